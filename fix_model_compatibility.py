@@ -73,7 +73,11 @@ def fix_model_compatibility():
                 if hasattr(old_model.xgb_geocoder, 'lon_model') and old_model.xgb_geocoder.lon_model is not None:
                     hybrid_model.xgb_geocoder.lon_model = old_model.xgb_geocoder.lon_model
                     print("✅ Longitude model extracted")
-                    
+
+                if getattr(old_model.xgb_geocoder, 'coord_model', None) is not None:
+                    hybrid_model.xgb_geocoder.coord_model = old_model.xgb_geocoder.coord_model
+                    print("✅ Multi-output coordinate model extracted")
+
         except Exception as e:
             print(f"⚠️ XGBoost model extraction failed: {e}")
             print("Will use fallback geocoding")
@@ -1,15 +1,13 @@
 import sys
 import joblib
 import os
+import importlib.util
 import json
 import pandas as pd
 import numpy as np
-import faiss
 import re
-import xgboost as xgb
+import threading
 from typing import Dict, List, Tuple, Optional
-from sentence_transformers import SentenceTransformer
-from sklearn.preprocessing import StandardScaler
 from fuzzywuzzy import process
 try:
     import fuzzy
@@ -23,21 +21,51 @@ from datetime import datetime, timezone, timedelta
 
 warnings.filterwarnings('ignore')
 
+ARTIFACT_VERSION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'scripts', 'artifact_version.py')
+
+@lru_cache(maxsize=None)
+def _artifact_version_module():
+    """src/scripts/artifact_version.py, loaded by path so importing this module leaves sys.path alone"""
+    if 'artifact_version' in sys.modules:
+        return sys.modules['artifact_version']
+    spec = importlib.util.spec_from_file_location('artifact_version', ARTIFACT_VERSION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
 # Set encoding for Windows compatibility
 if sys.platform.startswith('win'):
     import codecs
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
 
-# Global SentenceTransformer to avoid reloading
-SENTENCE_EMBEDDER = SentenceTransformer('paraphrase-MiniLM-L6-v2')
+@lru_cache(maxsize=None)
+def get_sentence_embedder():
+    """Process-wide SentenceTransformer, loaded on first use so importing this module stays cheap"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('paraphrase-MiniLM-L6-v2')
 
 # Define EnhancedXGBoostGeocoder class
 class EnhancedXGBoostGeocoder:
     def __init__(self):
+        self.coord_model = None
         self.lat_model = None
         self.lon_model = None
 
+    def __setstate__(self, state):
+        # Geocoders trained in multi-output mode keep one booster in coord_model instead
+        state.setdefault('coord_model', None)
+        self.__dict__.update(state)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.coord_model is not None or (self.lat_model is not None and self.lon_model is not None)
+
+    @property
+    def n_features_in_(self) -> int:
+        return (self.coord_model if self.coord_model is not None else self.lat_model).n_features_in_
+
     def train(self, X_train, y_train, X_val=None, y_val=None, weights_train=None):
+        import xgboost as xgb
         print("Training Enhanced XGBoost Geocoder...")
         params = {
             'objective': 'reg:squarederror',
@@ -63,6 +91,8 @@ class EnhancedXGBoostGeocoder:
         return self
 
     def predict(self, X):
+        if self.coord_model is not None:
+            return self.coord_model.predict(X).reshape(-1, 2)
         lat_pred = self.lat_model.predict(X)
         lon_pred = self.lon_model.predict(X)
         return np.column_stack((lat_pred, lon_pred))
@@ -71,8 +101,7 @@ class EnhancedXGBoostGeocoder:
 class HybridXGBFAISSGeocoder:
     def __init__(self, k_neighbors=3, models_dir="models"):
         self.xgb_geocoder = EnhancedXGBoostGeocoder()
-        self.faiss_lat_index = None
-        self.faiss_lon_index = None
+        self.faiss_index = None
         self.residuals = None
         self.k = k_neighbors
         self.X_train_ref = None
@@ -81,7 +110,16 @@ class HybridXGBFAISSGeocoder:
         self.residual_cap = 0.01
         self.models_dir = models_dir
 
+    def __setstate__(self, state):
+        # Models pickled before the shared index kept identical lat/lon indexes
+        if 'faiss_index' not in state:
+            state['faiss_index'] = state.get('faiss_lat_index')
+        state.pop('faiss_lat_index', None)
+        state.pop('faiss_lon_index', None)
+        self.__dict__.update(state)
+
     def train(self, X_train, y_train, X_val=None, y_val=None, weights_train=None):
+        import faiss
         print("🔥 Training Hybrid XGBoost + FAISS model...")
         self.xgb_geocoder.train(X_train, y_train, X_val, y_val, weights_train=weights_train)
         xgb_pred = self.xgb_geocoder.predict(X_train)
@@ -89,29 +127,29 @@ class HybridXGBFAISSGeocoder:
         self.weights_train = weights_train
         d = X_train.shape[1]
         X_train_f32 = X_train.astype(np.float32)
-        self.faiss_lat_index = faiss.IndexFlatL2(d)
-        self.faiss_lon_index = faiss.IndexFlatL2(d)
-        self.faiss_lat_index.add(X_train_f32)
-        self.faiss_lon_index.add(X_train_f32)
+        self.faiss_index = faiss.IndexFlatL2(d)
+        self.faiss_index.add(X_train_f32)
         self.X_train_ref = X_train_f32
         os.makedirs(self.models_dir, exist_ok=True)
-        faiss.write_index(self.faiss_lat_index, os.path.join(self.models_dir, 'faiss_lat_index.index'))
-        faiss.write_index(self.faiss_lon_index, os.path.join(self.models_dir, 'faiss_lon_index.index'))
+        faiss.write_index(self.faiss_index, os.path.join(self.models_dir, 'faiss_index.index'))
         np.save(os.path.join(self.models_dir, 'X_train_ref.npy'), X_train_f32)
         np.save(os.path.join(self.models_dir, 'residuals.npy'), self.residuals)
         if self.weights_train is not None:
             np.save(os.path.join(self.models_dir, 'sample_weights.npy'), self.weights_train)
-        self.faiss_lat_index = None
-        self.faiss_lon_index = None
+        self.faiss_index = None
         self.X_train_ref = None
         self.residuals = None
         self.weights_train = None
-        print(f"✅ FAISS indexes built with {len(X_train)} reference points")
+        print(f"✅ FAISS index built with {len(X_train)} reference points")
         return self
 
     def load_artifacts(self):
-        self.faiss_lat_index = faiss.read_index(os.path.join(self.models_dir, 'faiss_lat_index.index'))
-        self.faiss_lon_index = faiss.read_index(os.path.join(self.models_dir, 'faiss_lon_index.index'))
+        import faiss
+        index_path = os.path.join(self.models_dir, 'faiss_index.index')
+        if not os.path.exists(index_path):
+            # Older artifacts wrote the same index twice; the latitude copy serves both
+            index_path = os.path.join(self.models_dir, 'faiss_lat_index.index')
+        self.faiss_index = faiss.read_index(index_path)
         self.X_train_ref = np.load(os.path.join(self.models_dir, 'X_train_ref.npy'))
         self.residuals = np.load(os.path.join(self.models_dir, 'residuals.npy'))
         weights_path = os.path.join(self.models_dir, 'sample_weights.npy')
@@ -121,36 +159,52 @@ class HybridXGBFAISSGeocoder:
             self.weights_train = None
 
     def predict(self, X):
-        if self.xgb_geocoder.lat_model is None or self.xgb_geocoder.lon_model is None:
+        if not self.xgb_geocoder.is_trained:
             raise ValueError("Models not trained yet. Call train() first.")
-        if self.faiss_lat_index is None:
+        if self.faiss_index is None:
             self.load_artifacts()
         xgb_pred = self.xgb_geocoder.predict(X)
         X_f32 = X.astype(np.float32)
-        dist_lat, idx_lat = self.faiss_lat_index.search(X_f32, self.k)
-        dist_lon, idx_lon = self.faiss_lon_index.search(X_f32, self.k)
+        # One neighbour search drives both the latitude and longitude corrections
+        dist, idx = self.faiss_index.search(X_f32, self.k)
         eps = 1e-8
-        weights_lat = 1 / (dist_lat + eps)
-        weights_lon = 1 / (dist_lon + eps)
-        weights_lat /= weights_lat.sum(axis=1, keepdims=True)
-        weights_lon /= weights_lon.sum(axis=1, keepdims=True)
+        weights = 1 / (dist + eps)
+        weights /= weights.sum(axis=1, keepdims=True)
         if self.weights_train is not None:
-            weights_lat = weights_lat * self.weights_train[idx_lat]
-            weights_lon = weights_lon * self.weights_train[idx_lon]
-            weights_lat /= weights_lat.sum(axis=1, keepdims=True)
-            weights_lon /= weights_lon.sum(axis=1, keepdims=True)
-        correction_lat = (weights_lat * self.residuals[idx_lat, 0]).sum(axis=1)
-        correction_lon = (weights_lon * self.residuals[idx_lon, 1]).sum(axis=1)
-        final_pred = xgb_pred + np.column_stack((correction_lat, correction_lon))
-        self.faiss_lat_index = None
-        self.faiss_lon_index = None
-        self.X_train_ref = None
-        self.residuals = None
-        self.weights_train = None
+            weights = weights * self.weights_train[idx]
+            weights /= weights.sum(axis=1, keepdims=True)
+        correction = (weights[:, :, None] * self.residuals[idx]).sum(axis=1)
+        final_pred = xgb_pred + correction
         return final_pred
 
 # Define FixedHybridGeocoder class
 class FixedHybridGeocoder:
+    # Loaded instances by (resolved models_dir, artifact_version)
+    _instances: Dict[Tuple[str, str], 'FixedHybridGeocoder'] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, models_dir: str = "models") -> 'FixedHybridGeocoder':
+        """Geocoder with its artifacts loaded once per process and reloaded when the files change.
+
+        An instance whose artifacts failed to load is returned but not kept, so the next call retries.
+        """
+        resolved_dir = os.path.realpath(models_dir)
+        key = (resolved_dir, _artifact_version_module().artifact_version(resolved_dir))
+        instance = cls._instances.get(key)
+        if instance is not None:
+            return instance
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(models_dir=resolved_dir)
+                instance.load_artifacts()
+                if instance.is_loaded:
+                    for stale_key in [k for k in cls._instances if k[0] == resolved_dir]:
+                        del cls._instances[stale_key]
+                    cls._instances[key] = instance
+        return instance
+
     def __init__(self, models_dir: str = "models"):
         self.models_dir = models_dir
         self.artifacts = {}
@@ -177,7 +231,7 @@ class FixedHybridGeocoder:
             self.artifacts['feature_scaler'] = joblib.load(os.path.join(self.models_dir, 'feature_scaler.pkl'))
             self.artifacts['tfidf_vectorizer'] = joblib.load(os.path.join(self.models_dir, 'tfidf_vectorizer.pkl'))
             self.artifacts['manual_feature_columns'] = joblib.load(os.path.join(self.models_dir, 'manual_feature_columns.pkl'))
-            self.artifacts['sentence_embedder'] = SENTENCE_EMBEDDER
+            self.artifacts['sentence_embedder'] = get_sentence_embedder()
             self.artifacts['geo_stats'] = joblib.load(os.path.join(self.models_dir, 'geo_stats.pkl'))
             with open(os.path.join(self.models_dir, 'address_normalization_dicts.json'), 'r', encoding='utf-8') as f:
                 address_dicts = json.load(f)
@@ -212,7 +266,7 @@ class FixedHybridGeocoder:
     def _validate_loaded_components(self):
         if 'hybrid_model' in self.artifacts and 'metadata' in self.artifacts:
             expected_dims = self.artifacts['metadata']['feature_dimensions']
-            actual_dims = self.artifacts['hybrid_model'].xgb_geocoder.lat_model.n_features_in_
+            actual_dims = self.artifacts['hybrid_model'].xgb_geocoder.n_features_in_
             if expected_dims != actual_dims:
                 raise ValueError(f"Feature dimension mismatch: expected {expected_dims}, got {actual_dims}")
 
@@ -543,9 +597,13 @@ GCC_TZ = timezone(timedelta(hours=3))
 # Get the directory of the current script
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Load models with correct paths
-distance_model = joblib.load(os.path.join(current_dir, "distance_model.pkl"))
-eta_model = joblib.load(os.path.join(current_dir, "eta_model.pkl"))
+@lru_cache(maxsize=None)
+def get_distance_model():
+    return joblib.load(os.path.join(current_dir, "distance_model.pkl"))
+
+@lru_cache(maxsize=None)
+def get_eta_model():
+    return joblib.load(os.path.join(current_dir, "eta_model.pkl"))
 
 def predict_eta_distance_with_addresses(
     pickup_address,
@@ -556,15 +614,14 @@ def predict_eta_distance_with_addresses(
     try:
         # Initialize geocoder with correct models directory path
         models_dir = os.path.join(current_dir, "models")
-        geocoder = FixedHybridGeocoder(models_dir=models_dir)
+        geocoder = FixedHybridGeocoder.get_instance(models_dir=models_dir)
         
         # Convert addresses to coordinates
         print("Converting addresses to coordinates...")
         addresses = [pickup_address, dropoff_address]
         
-        # Try to load geocoder artifacts
+        # Geocode with the shared instance (artifacts are loaded once per process)
         try:
-            geocoder.load_artifacts()
             geocoding_results = geocoder.predict_coordinates_hybrid(addresses)
         except Exception as e:
             print(f"Warning: Advanced geocoding failed ({e}), using fallback")
@@ -643,7 +700,7 @@ def predict_eta_distance(
     distance_df = pd.DataFrame(distance_input)
 
     # Estimate distance (meters)
-    distance = distance_model.predict(distance_df)[0]
+    distance = get_distance_model().predict(distance_df)[0]
 
     # Prepare input for ETA model
     eta_input = {
@@ -659,7 +716,7 @@ def predict_eta_distance(
     # Convert to DataFrame
     eta_df = pd.DataFrame(eta_input)
 
-    eta = eta_model.predict(eta_df)[0]
+    eta = get_eta_model().predict(eta_df)[0]
 
     return {
         "distance_meters": round(float(distance), 2),
@@ -1,6 +1,24 @@
 /**
  * Application configuration
  */
+
+/**
+ * Worker CLI arguments: a JSON array of strings, or a whitespace-separated list
+ * @param {string} value - e.g. PYTHON_WORKER_ARGS
+ * @returns {string[]} - Arguments
+ */
+const parseWorkerArgs = (value) => {
+  const trimmed = (value || '').trim();
+  if (trimmed.startsWith('[')) {
+    const args = JSON.parse(trimmed);
+    if (!Array.isArray(args) || !args.every((arg) => typeof arg === 'string')) {
+      throw new Error('PYTHON_WORKER_ARGS must be a JSON array of strings');
+    }
+    return args;
+  }
+  return trimmed ? trimmed.split(/\s+/) : [];
+};
+
 const config = {
   port: process.env.PORT || 3000,
   environment: process.env.NODE_ENV || 'development',
@@ -13,6 +31,16 @@ const config = {
   },
   apiVersion: process.env.API_VERSION || 'v1',
   requestTimeout: parseInt(process.env.REQUEST_TIMEOUT || '15000', 10),
+
+  // Resident Python prediction worker (falls back to one script per request when disabled)
+  pythonWorker: {
+    enabled: process.env.PYTHON_WORKER_ENABLED !== 'false',
+    args: parseWorkerArgs(process.env.PYTHON_WORKER_ARGS),
+    // How long the worker may take to load its models before it is killed and respawned
+    startTimeout: parseInt(process.env.PYTHON_WORKER_START_TIMEOUT || '300000', 10),
+    // Geocoding budget passed to the worker; it answers with the best tier finished in time
+    geocodeBudgetMs: parseInt(process.env.GEOCODE_BUDGET_MS || '10000', 10)
+  },
   
   // MongoDB configuration
   mongodb: {
@@ -0,0 +1,33 @@
+"""
+Fingerprint of a model directory, used to key loaded-model registries.
+
+Kept free of third-party imports so any entry point (geocoder.py, combinedModel.py)
+can check whether its artifacts changed without importing the geocoder itself.
+"""
+
+import os
+import hashlib
+
+def artifact_version(models_dir: str) -> str:
+    """Fingerprint of the files in models_dir and its immediate subdirectories (name, size, mtime)
+
+    Cheap enough to check on every call: only directory entries are read, never file contents,
+    so retraining into the same directory changes the version without anything being hashed.
+    """
+    digest = hashlib.sha1()
+    directories = [models_dir]
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                if directory == models_dir:
+                    directories.append(entry.path)
+                continue
+            stat = entry.stat()
+            rel_path = os.path.relpath(entry.path, models_dir).replace(os.sep, '/')
+            digest.update(f"{rel_path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
@@ -0,0 +1,264 @@
+"""
+Streaming batch geocoding for large address files.
+
+Addresses are read from CSV, JSONL or Parquet in fixed-size chunks, exact
+duplicates within a chunk are geocoded once, and chunks are fanned out to a
+process pool whose workers each hold a loaded FixedHybridGeocoder. Results are
+written as each chunk completes, in input order, and at most a few chunks per
+worker are in flight, so memory stays constant however long the input is.
+Parquet needs pyarrow (`pip install pyarrow`).
+
+Usage: python geocoder.py batch INPUT OUTPUT [--column address] [--id-column ID] [--workers N] [--chunk-size N]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BATCH_FORMATS = ('csv', 'jsonl', 'parquet')
+BATCH_OUTPUT_FIELDS = ('input', 'parsed_area', 'parsed_block', 'parsed_street', 'parsed_buildingNumber',
+                       'parsed_governorate', 'latitude', 'longitude', 'status', 'confidence', 'error')
+
+# Geocoder held by each pool worker (or by the parent when workers=0)
+_WORKER_GEOCODER = None
+_WORKER_INIT_ERROR = None
+
+def detect_format(path: str, explicit: Optional[str] = None) -> str:
+    if explicit:
+        if explicit not in BATCH_FORMATS:
+            raise ValueError(f"Unknown batch format: {explicit}. Expected one of {BATCH_FORMATS}")
+        return explicit
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    raise ValueError(f"Cannot tell the format of {path}; pass one of {BATCH_FORMATS} explicitly")
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet input/output needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+def _as_address(value) -> str:
+    return '' if value is None else str(value)
+
+def read_address_chunks(path: str, column: str = 'address', chunk_size: int = 1000, input_format: Optional[str] = None,
+                        id_column: Optional[str] = None) -> Iterator[Tuple[List[str], Optional[List]]]:
+    """Yield (addresses, ids) per chunk of at most chunk_size rows; ids is None without an id_column"""
+    input_format = detect_format(path, input_format)
+    if input_format == 'parquet':
+        pyarrow = _import_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        columns = [column] + ([id_column] if id_column else [])
+        for name in columns:
+            if name not in parquet_file.schema_arrow.names:
+                raise ValueError(f"Column {name!r} not found in {path}")
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            batch = batch.to_pydict()
+            yield [_as_address(value) for value in batch[column]], batch[id_column] if id_column else None
+        return
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if input_format == 'csv':
+            rows = csv.DictReader(f)
+            if column not in (rows.fieldnames or []):
+                raise ValueError(f"Column {column!r} not found in {path}")
+        else:
+            rows = _jsonl_rows(f, path, column)
+        addresses, ids = [], []
+        for row in rows:
+            addresses.append(_as_address(row.get(column)))
+            if id_column:
+                ids.append(row.get(id_column))
+            if len(addresses) == chunk_size:
+                yield addresses, ids if id_column else None
+                addresses, ids = [], []
+        if addresses:
+            yield addresses, ids if id_column else None
+
+def _jsonl_rows(f, path: str, column: str) -> Iterator[Dict]:
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        if column not in row:
+            raise ValueError(f"Column {column!r} not found on line {line_number} of {path}")
+        yield row
+
+def input_id_type(path: str, id_column: Optional[str], input_format: Optional[str] = None):
+    """pyarrow type of the id column as read from path, or None when it can only be inferred from the values"""
+    if not id_column:
+        return None
+    input_format = detect_format(path, input_format)
+    pyarrow = _import_pyarrow()
+    if input_format == 'csv':
+        return pyarrow.string()
+    if input_format == 'parquet':
+        return pyarrow.parquet.read_schema(path).field(id_column).type
+    return None
+
+class BatchResultWriter:
+    def __init__(self, path: str, output_format: Optional[str] = None, id_column: Optional[str] = None, id_type=None):
+        """Append result rows to CSV, JSONL or Parquet as chunks complete
+
+        id_type is the pyarrow type of id_column in Parquet output; without it the type is
+        inferred from the first chunk written.
+        """
+        self.path = path
+        self.output_format = detect_format(path, output_format)
+        self.id_column = id_column
+        self.id_type = id_type
+        self.fields = ([id_column] if id_column else []) + list(BATCH_OUTPUT_FIELDS)
+        self.rows_written = 0
+        self._file = None
+        self._csv = None
+        self._parquet = None
+        if self.output_format == 'parquet':
+            _import_pyarrow()
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+            if self.output_format == 'csv':
+                self._csv = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction='ignore')
+                self._csv.writeheader()
+
+    def write(self, rows: List[Dict]) -> None:
+        if self.output_format == 'csv':
+            self._csv.writerows(rows)
+        elif self.output_format == 'jsonl':
+            self._file.writelines(json.dumps({field: row.get(field) for field in self.fields if field in row},
+                                             ensure_ascii=False) + '\n' for row in rows)
+        else:
+            pyarrow = _import_pyarrow()
+            if self._parquet is None:
+                schema = pyarrow.schema([(field, pyarrow.float64() if field in ('latitude', 'longitude') else pyarrow.string())
+                                         for field in BATCH_OUTPUT_FIELDS])
+                if self.id_column:
+                    id_type = self.id_type or pyarrow.array([row.get(self.id_column) for row in rows]).type
+                    schema = schema.insert(0, pyarrow.field(self.id_column, id_type))
+                self._parquet = pyarrow.parquet.ParquetWriter(self.path, schema)
+            schema = self._parquet.schema_arrow
+            table = pyarrow.Table.from_pylist([
+                {field: row.get(field) if field in ('latitude', 'longitude', self.id_column) or row.get(field) is None
+                 else str(row[field]) for field in self.fields} for row in rows
+            ], schema=schema)
+            self._parquet.write_table(table)
+        if self._file is not None:
+            self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+
+def _limit_threads(threads: int) -> None:
+    # Forked workers inherit torch/FAISS pools that ignore OMP_NUM_THREADS, so set them directly
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+    if 'faiss' in sys.modules:
+        sys.modules['faiss'].omp_set_num_threads(threads)
+
+def _init_worker(geocoder_kwargs: Dict, threads_per_worker: Optional[int] = None) -> None:
+    global _WORKER_GEOCODER, _WORKER_INIT_ERROR
+    if threads_per_worker:
+        # Keep each worker's BLAS/OpenMP pools (torch, FAISS) from oversubscribing the cores;
+        # the variables only reach libraries that start their pools after this point
+        for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            os.environ[variable] = str(threads_per_worker)
+    try:
+        from geocoder import FixedHybridGeocoder
+        _WORKER_GEOCODER = FixedHybridGeocoder(**geocoder_kwargs)
+        if threads_per_worker:
+            _limit_threads(threads_per_worker)
+    except Exception as e:
+        # A pool initializer that raises is respawned forever and the job hangs, so the
+        # error is kept and raised by the first chunk this worker is given instead
+        _WORKER_INIT_ERROR = f"{type(e).__name__}: {e}"
+
+def _geocode_chunk(addresses: List[str]) -> Tuple[List[Dict], List[int], int]:
+    """Geocode each distinct address once; returns (unique results, index of each input row into them, distinct keys)
+
+    Only exact duplicates are collapsed here, which keeps the results sent back small; the
+    geocoder further merges addresses that normalize or parse to the same key.
+    """
+    if _WORKER_INIT_ERROR is not None:
+        raise RuntimeError(f"Geocoder failed to load in batch worker {os.getpid()}: {_WORKER_INIT_ERROR}")
+    positions = {}
+    inverse = [positions.setdefault(address, len(positions)) for address in addresses]
+    metadata = {}
+    results = _WORKER_GEOCODER.predict_coordinates_hybrid(list(positions), metadata=metadata)
+    return results, inverse, metadata.get('unique_keys', len(positions))
+
+def _expand_rows(unique_results: List[Dict], inverse: List[int], ids: Optional[List], id_column: Optional[str]) -> List[Dict]:
+    rows = [unique_results[index] for index in inverse]
+    if id_column:
+        rows = [dict(row, **{id_column: row_id}) for row, row_id in zip(rows, ids)]
+    return rows
+
+def run_batch_geocoding(input_path: str, output_path: str, column: str = 'address', id_column: Optional[str] = None,
+                        chunk_size: int = 1000, workers: Optional[int] = None, input_format: Optional[str] = None,
+                        output_format: Optional[str] = None, geocoder_kwargs: Optional[Dict] = None,
+                        max_pending_chunks: Optional[int] = None, progress_seconds: float = 10.0) -> Dict:
+    """Geocode every address in input_path into output_path, preserving row order
+
+    workers=0 geocodes in this process. At most max_pending_chunks (default two per worker)
+    chunks are read ahead of the writer, which bounds memory independently of the input size.
+    """
+    geocoder_kwargs = dict(geocoder_kwargs or {})
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    max_pending_chunks = max_pending_chunks or max(2, 2 * workers)
+    chunks = read_address_chunks(input_path, column, chunk_size, input_format, id_column)
+    id_type = input_id_type(input_path, id_column, input_format) if detect_format(output_path, output_format) == 'parquet' else None
+    writer = BatchResultWriter(output_path, output_format, id_column, id_type)
+    stats = {'rows': 0, 'unique_addresses': 0, 'unique_keys': 0, 'chunks': 0, 'workers': workers}
+    started = last_report = time.perf_counter()
+
+    def write_chunk(result, ids):
+        nonlocal last_report
+        unique_results, inverse, unique_keys = result
+        writer.write(_expand_rows(unique_results, inverse, ids, id_column))
+        stats['rows'] += len(inverse)
+        stats['unique_addresses'] += len(unique_results)
+        stats['unique_keys'] += unique_keys
+        stats['chunks'] += 1
+        now = time.perf_counter()
+        if now - last_report >= progress_seconds:
+            last_report = now
+            print(f"Geocoded {stats['rows']} rows ({stats['rows'] / (now - started):.0f} rows/s)", file=sys.stderr)
+
+    try:
+        if workers == 0:
+            _init_worker(geocoder_kwargs)
+            for addresses, ids in chunks:
+                write_chunk(_geocode_chunk(addresses), ids)
+        else:
+            import multiprocessing
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            with multiprocessing.Pool(workers, initializer=_init_worker,
+                                      initargs=(geocoder_kwargs, threads_per_worker)) as pool:
+                pending = deque()
+                for addresses, ids in chunks:
+                    pending.append((pool.apply_async(_geocode_chunk, (addresses,)), ids))
+                    if len(pending) >= max_pending_chunks:
+                        result, pending_ids = pending.popleft()
+                        write_chunk(result.get(), pending_ids)
+                while pending:
+                    result, pending_ids = pending.popleft()
+                    write_chunk(result.get(), pending_ids)
+    finally:
+        writer.close()
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    stats['duplicate_ratio'] = 1 - stats['unique_addresses'] / stats['rows'] if stats['rows'] else 0.0
+    stats['dedup_ratio'] = 1 - stats['unique_keys'] / stats['rows'] if stats['rows'] else 0.0
+    return stats
@@ -0,0 +1,65 @@
+"""
+Inference backends for the geocoder's sentence embedder.
+
+'torch' runs the saved SentenceTransformer as trained. 'onnx' and 'onnx-int8'
+run an ONNX export of the same model (fp32, or with dynamically quantized int8
+weights) on ONNX Runtime, which needs `pip install sentence-transformers[onnx]`.
+export_onnx_embedder() writes both exports into the model's onnx/ folder.
+"""
+
+import os
+import shutil
+import platform
+import tempfile
+from typing import Dict, Optional
+
+EMBEDDER_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+def onnx_quantization_config() -> str:
+    """Quantization preset for this CPU: arm64 on ARM, otherwise avx2 (runs on any x86-64 node)"""
+    return 'arm64' if platform.machine().lower() in ('arm64', 'aarch64') else 'avx2'
+
+def onnx_model_file(backend: str, quantization_config: Optional[str] = None) -> str:
+    """Path of the backend's ONNX file relative to the embedder directory"""
+    if backend == 'onnx':
+        return os.path.join('onnx', 'model.onnx')
+    if backend == 'onnx-int8':
+        return os.path.join('onnx', f"model_qint8_{quantization_config or onnx_quantization_config()}.onnx")
+    raise ValueError(f"Backend {backend} has no ONNX file")
+
+def load_sentence_embedder(embedder_path: str, backend: str = 'torch',
+                           quantization_config: Optional[str] = None):
+    """Load the embedder for a backend; sentence_transformers (and torch) are imported only here"""
+    from sentence_transformers import SentenceTransformer
+    if backend not in EMBEDDER_BACKENDS:
+        raise ValueError(f"Unknown embedder backend: {backend}. Expected one of {EMBEDDER_BACKENDS}")
+    if backend == 'torch':
+        return SentenceTransformer(embedder_path)
+    file_name = onnx_model_file(backend, quantization_config)
+    if not os.path.exists(os.path.join(embedder_path, file_name)):
+        raise FileNotFoundError(f"{file_name} not found in {embedder_path}; run `python geocoder.py export-onnx` first")
+    return SentenceTransformer(embedder_path, backend='onnx',
+                               model_kwargs={'file_name': file_name, 'provider': 'CPUExecutionProvider'})
+
+def export_onnx_embedder(embedder_path: str, quantization_config: Optional[str] = None) -> Dict[str, str]:
+    """Export the saved embedder to ONNX (fp32) and a dynamically quantized int8 copy next to it
+
+    Only the onnx/ folder of embedder_path is written. save_pretrained also rewrites the
+    configs, modules.json and README, which embedder_identity hashes, so the export is saved
+    to a scratch directory and just its ONNX files are copied over; stored torch embeddings
+    stay valid.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    quantization_config = quantization_config or onnx_quantization_config()
+    # Loading with the ONNX backend converts the PyTorch weights when no export exists yet
+    model = SentenceTransformer(embedder_path, backend='onnx')
+    onnx_dir = os.path.join(embedder_path, 'onnx')
+    with tempfile.TemporaryDirectory(prefix='onnx-export-') as export_dir:
+        model.save_pretrained(export_dir)
+        export_dynamic_quantized_onnx_model(model, quantization_config, export_dir)
+        os.makedirs(onnx_dir, exist_ok=True)
+        # External weight files (model.onnx_data) sit next to the graphs they belong to
+        for name in os.listdir(os.path.join(export_dir, 'onnx')):
+            shutil.copy2(os.path.join(export_dir, 'onnx', name), os.path.join(onnx_dir, name))
+    return {backend: os.path.join(embedder_path, onnx_model_file(backend, quantization_config))
+            for backend in ('onnx', 'onnx-int8')}
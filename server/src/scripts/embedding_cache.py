@@ -0,0 +1,278 @@
+"""
+Bounded caches for the geocoder's per-address intermediate results.
+
+EmbeddingCache keeps sentence embeddings in one preallocated contiguous
+arena (float32, or float16 to halve memory) with a key -> slot map and LRU
+eviction; LRUCache is the same policy for small scalar values such as the
+area similarity scores. DiskEmbeddingStore persists embeddings in SQLite so
+they survive restarts and are shared by every worker process on the host.
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+class LRUCache:
+    def __init__(self, max_entries: int = 10000):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value) -> None:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            elif len(self._data) >= self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._data[key] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'capacity': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+class EmbeddingCache:
+    def __init__(self, max_entries: Optional[int] = 20000, max_bytes: Optional[int] = None, dtype=np.float32):
+        """Bound the cache by entry count, by arena bytes, or both (the tighter wins).
+
+        The arena is allocated on the first put(), once the embedding width is known.
+        """
+        if max_entries is None and max_bytes is None:
+            raise ValueError("Either max_entries or max_bytes must be set")
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.float32), np.dtype(np.float16)):
+            raise ValueError(f"Unsupported embedding cache dtype: {self.dtype}")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.capacity = None
+        self._arena = None
+        self._slots = OrderedDict()
+        self._free = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slots
+
+    def _allocate(self, dim: int) -> None:
+        capacity = self.max_entries if self.max_entries is not None else np.iinfo(np.int64).max
+        if self.max_bytes is not None:
+            capacity = min(capacity, self.max_bytes // (dim * self.dtype.itemsize))
+        if capacity <= 0:
+            raise ValueError(f"Embedding cache budget too small for {dim}-dimensional embeddings")
+        self.capacity = int(capacity)
+        self._arena = np.empty((self.capacity, dim), dtype=self.dtype)
+        self._free = list(range(self.capacity - 1, -1, -1))
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        """Return a float32 copy of the cached embedding, or None"""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(key)
+            self.hits += 1
+            return self._arena[slot].astype(np.float32)
+
+    def get_many(self, keys: List[Hashable]) -> List[Optional[np.ndarray]]:
+        return [self.get(key) for key in keys]
+
+    def put(self, key: Hashable, embedding: np.ndarray) -> None:
+        embedding = np.asarray(embedding)
+        with self._lock:
+            if self._arena is None:
+                self._allocate(embedding.shape[-1])
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._slots.move_to_end(key)
+            else:
+                if not self._free:
+                    _, slot_freed = self._slots.popitem(last=False)
+                    self._free.append(slot_freed)
+                    self.evictions += 1
+                slot = self._free.pop()
+                self._slots[key] = slot
+            self._arena[slot] = embedding
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slots.clear()
+            if self.capacity is not None:
+                self._free = list(range(self.capacity - 1, -1, -1))
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._slots),
+            'capacity': self.capacity,
+            'dtype': self.dtype.name,
+            'arena_bytes': 0 if self._arena is None else self._arena.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+def embedder_identity(embedder_path: str, backend: str = 'torch', backend_file: Optional[str] = None) -> str:
+    """Fingerprint a saved SentenceTransformer directory
+
+    Hashes every file's relative path and size plus the contents of the small
+    JSON configs, so a retrained or swapped embedder never reads stale vectors.
+    ONNX exports are left out of the base hash and only the file a non-torch
+    backend actually runs is added, since each backend yields slightly different vectors.
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(embedder_path):
+        if root == embedder_path and 'onnx' in dirs:
+            dirs.remove('onnx')
+        dirs.sort()
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            rel_path = os.path.relpath(full_path, embedder_path).replace(os.sep, '/')
+            digest.update(f"{rel_path}:{os.path.getsize(full_path)}\n".encode('utf-8'))
+            if name.endswith('.json'):
+                with open(full_path, 'rb') as f:
+                    digest.update(f.read())
+    if backend != 'torch':
+        digest.update(f"backend:{backend}\n".encode('utf-8'))
+        if backend_file is not None:
+            full_path = os.path.join(embedder_path, backend_file)
+            digest.update(f"{backend_file.replace(os.sep, '/')}:{os.path.getsize(full_path)}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+class DiskEmbeddingStore:
+    # SQLite caps host parameters per statement (999 on older builds)
+    QUERY_CHUNK = 500
+
+    def __init__(self, path: str, embedder_id: str, timeout: float = 5.0):
+        self.path = path
+        self.embedder_id = embedder_id
+        self.timeout = timeout
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.write_errors = 0
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            # WAL lets any number of readers proceed while one process writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "embedder TEXT NOT NULL, text TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (embedder, text)) WITHOUT ROWID"
+            )
+            conn.commit()
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Return {text: float32 embedding} for the texts present in the store"""
+        found = {}
+        unique_texts = list(dict.fromkeys(texts))
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(unique_texts), self.QUERY_CHUNK):
+                chunk = unique_texts[start:start + self.QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f"SELECT text, vector FROM embeddings WHERE embedder = ? AND text IN ({placeholders})",
+                    [self.embedder_id] + chunk
+                ).fetchall()
+                for text, vector in rows:
+                    found[text] = np.frombuffer(vector, dtype=np.float32)
+            self.hits += len(found)
+            self.misses += len(unique_texts) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> None:
+        rows = {}
+        for text, embedding in items:
+            embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+            rows[text] = (self.embedder_id, text, embedding.shape[-1], embedding.tobytes())
+        rows = list(rows.values())
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO embeddings (embedder, text, dim, vector) VALUES (?, ?, ?, ?)", rows
+                    )
+                self.writes += len(rows)
+            except sqlite3.OperationalError:
+                # A busy store only costs a future re-encode; never fail the prediction over it
+                self.write_errors += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits, misses, writes, write_errors = self.hits, self.misses, self.writes, self.write_errors
+        lookups = hits + misses
+        return {
+            'path': self.path,
+            'embedder_id': self.embedder_id,
+            'hits': hits,
+            'misses': misses,
+            'writes': writes,
+            'write_errors': write_errors,
+            'hit_rate': hits / lookups if lookups else 0.0
+        }
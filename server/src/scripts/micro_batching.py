@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Asyncio micro-batching front end for the prediction worker
+
+Concurrent requests each geocode two addresses and predict one ETA, which leaves the
+embedder's batch_size=64 and the vectorized XGBoost/FAISS/LightGBM paths mostly idle.
+MicroBatcher collects calls for up to max_wait_ms or max_items, runs them as one batch on
+the model thread and hands each caller its own result. MicroBatchingPredictor uses one
+batcher for addresses (predict_coordinates_hybrid) and one for trips (distance + ETA), and
+SingleFlight lets concurrent requests for the same addresses or trip share one computation.
+
+Usage: python prediction_worker.py --micro-batch-ms 2 [--micro-batch-size 64] [--no-coalesce] [worker options]
+       python micro_batching.py benchmark [--requests 2000] [--concurrency 32] [--models-dir DIR]
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence
+
+# Add path for sibling script imports
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+# Trips whose coordinates agree to this many decimals (about 1 m) share an ETA computation
+COORDINATE_KEY_DECIMALS = 5
+
+class SingleFlight:
+    """Concurrent callers asking for the same key share one in-flight computation and its result or exception"""
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable]):
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._in_flight.pop(key) if self._in_flight.get(key) is done else None)
+        else:
+            self.shared += 1
+        # Shielded so a caller that is cancelled does not cancel the computation the others wait on
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._in_flight),
+                'shared_fraction': self.shared / self.calls if self.calls else 0.0}
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[List], Sequence], max_items: int = 64, max_wait_ms: float = 2.0,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        """Group submit() calls into batches of at most max_items, waiting at most max_wait_ms for one to fill
+
+        run_batch(items) runs on `executor` and returns one result per item, in order; an
+        exception it raises is raised to every caller in that batch.
+        """
+        self.run_batch = run_batch
+        self.max_items = max(1, max_items)
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+        self._running = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.run_batch, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # A caller that was cancelled while waiting has nobody to hand its result to
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {'batches': self.batches, 'items': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0}
+
+class MicroBatchingPredictor:
+    def __init__(self, geocoder, eta_model, distance_model=None, max_wait_ms: float = 2.0, max_items: int = 64,
+                 coalesce: bool = True, coordinate_decimals: Optional[int] = COORDINATE_KEY_DECIMALS):
+        """Async geocoding and ETA calls answered from shared batches
+
+        Every batch runs on one model thread, so the geocoder and the models are never used
+        from two threads at once, and the next batch fills while the current one runs.
+        With coalesce, a request identical to one already in flight waits for that one instead:
+        address pairs are compared by canonical_address_key plus GCC hour and day, and trips by
+        coordinates rounded to coordinate_decimals (None compares them exactly) plus hour and day.
+        Each caller still gets its own input text, coordinates and local time in its result.
+        The shared computation runs under the first caller's time budget.
+        """
+        self.geocoder = geocoder
+        self.eta_model = eta_model
+        self.distance_model = distance_model
+        self.flights = SingleFlight() if coalesce else None
+        self.coordinate_decimals = coordinate_decimals
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prediction-models')
+        self.address_batcher = MicroBatcher(self._geocode_batch, max_items, max_wait_ms, self.executor)
+        self.trip_batcher = MicroBatcher(self._trip_batch, max_items, max_wait_ms, self.executor)
+
+    def _geocode_batch(self, items: List) -> List[Dict]:
+        # The batch has to finish within its most urgent caller's deadline
+        deadlines = [deadline for _, deadline in items if deadline is not None]
+        time_budget_ms = max(0.0, (min(deadlines) - time.monotonic()) * 1000.0) if deadlines else None
+        return self.geocoder.predict_coordinates_hybrid([address for address, _ in items], time_budget_ms=time_budget_ms)
+
+    def _trip_batch(self, trips: List) -> List:
+        from predict_eta import predict_eta_batch
+        from predict_combined import estimate_distance_batch
+        distances = estimate_distance_batch([trip[:4] for trip in trips], self.distance_model)
+        return list(zip(distances, predict_eta_batch(self.eta_model, trips).tolist()))
+
+    async def geocode(self, address: str, deadline: Optional[float] = None) -> Dict:
+        return await self.address_batcher.submit((address, deadline))
+
+    async def geocode_many(self, addresses: List[str], time_budget_ms: Optional[float] = None) -> List[Dict]:
+        deadline = time.monotonic() + time_budget_ms / 1000.0 if time_budget_ms is not None else None
+        return list(await asyncio.gather(*(self.geocode(address, deadline) for address in addresses)))
+
+    async def _coalesced(self, key: Hashable, compute: Callable[[], Awaitable]):
+        if self.flights is None:
+            return await compute()
+        return await self.flights.do(key, compute)
+
+    async def predict_trip(self, pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week):
+        """(distance_meters, eta_minutes) for one trip"""
+        from predict_eta import encode_day_of_week
+        # Reject an unknown day here so it fails this caller and not the whole batch
+        encode_day_of_week(day_of_week)
+        trip = (float(pickup_lat), float(pickup_lon), float(drop_lat), float(drop_lon), int(hour_of_day), day_of_week)
+        coordinates = trip[:4] if self.coordinate_decimals is None else tuple(round(value, self.coordinate_decimals)
+                                                                              for value in trip[:4])
+        return await self._coalesced(('trip',) + coordinates + trip[4:], lambda: self.trip_batcher.submit(trip))
+
+    async def predict_eta(self, pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week) -> float:
+        return (await self.predict_trip(pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week))[1]
+
+    async def predict_eta_distance(self, pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_time_utc_str) -> Dict:
+        """Same result as predict_combined.predict_eta_distance, from shared batches"""
+        from predict_combined import build_result, gcc_pickup_time
+        try:
+            pickup_time_gcc, day_of_week, hour_of_day = gcc_pickup_time(pickup_time_utc_str)
+            distance_meters, eta_minutes = await self.predict_trip(pickup_lat, pickup_lon, drop_lat, drop_lon,
+                                                                   hour_of_day, day_of_week)
+            return build_result(distance_meters, eta_minutes, pickup_lat, pickup_lon, drop_lat, drop_lon,
+                                pickup_time_gcc, day_of_week, hour_of_day)
+        except Exception as e:
+            raise Exception(f"Prediction failed: {str(e)}")
+
+    async def _geocode_pair_and_trip(self, pickup_address, dropoff_address, hour_of_day, day_of_week, deadline):
+        pickup_result, dropoff_result = await asyncio.gather(self.geocode(pickup_address, deadline),
+                                                             self.geocode(dropoff_address, deadline))
+        distance_meters, eta_minutes = await self.predict_trip(pickup_result['latitude'], pickup_result['longitude'],
+                                                               dropoff_result['latitude'], dropoff_result['longitude'],
+                                                               hour_of_day, day_of_week)
+        return pickup_result, dropoff_result, distance_meters, eta_minutes
+
+    async def predict_combined_address(self, pickup_address, dropoff_address, pickup_time_utc_str,
+                                       time_budget_ms: Optional[float] = None) -> Dict:
+        """Same result as simple_combined_address.predict_combined_address, from shared batches"""
+        from predict_combined import build_result, gcc_pickup_time
+        try:
+            deadline = time.monotonic() + time_budget_ms / 1000.0 if time_budget_ms is not None else None
+            pickup_time_gcc, day_of_week, hour_of_day = gcc_pickup_time(pickup_time_utc_str)
+            key = ('addresses', self.geocoder.canonical_address_key(pickup_address),
+                   self.geocoder.canonical_address_key(dropoff_address), hour_of_day, day_of_week)
+            pickup_result, dropoff_result, distance_meters, eta_minutes = await self._coalesced(
+                key, lambda: self._geocode_pair_and_trip(pickup_address, dropoff_address, hour_of_day, day_of_week, deadline))
+            result = build_result(distance_meters, eta_minutes, pickup_result['latitude'], pickup_result['longitude'],
+                                  dropoff_result['latitude'], dropoff_result['longitude'],
+                                  pickup_time_gcc, day_of_week, hour_of_day)
+            # Copies, since coalesced callers share the same geocoding results
+            result['geocoding'] = {'pickup': dict(pickup_result, input=pickup_address),
+                                   'dropoff': dict(dropoff_result, input=dropoff_address)}
+            return result
+        except Exception as e:
+            raise Exception(f"Address-based prediction failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {'addresses': self.address_batcher.stats(), 'trips': self.trip_batcher.stats(),
+                'coalesced': self.flights.stats() if self.flights is not None else None}
+
+async def handle_micro_batched(worker, predictor: MicroBatchingPredictor, request) -> Dict:
+    """worker.handle, with the batchable methods answered through `predictor`"""
+    if not isinstance(request, dict):
+        return worker.handle(request)
+    method, params, request_id = request.get('method'), request.get('params') or {}, request.get('id')
+    try:
+        if method == 'predict_eta':
+            eta_minutes = await predictor.predict_eta(params['pickup_lat'], params['pickup_lon'], params['drop_lat'],
+                                                      params['drop_lon'], params['hour_of_day'], params['day_of_week'])
+            return {'id': request_id, 'result': {'estimated_eta_minutes': round(float(eta_minutes), 2)}}
+        if method == 'predict_eta_distance':
+            return {'id': request_id, 'result': await predictor.predict_eta_distance(
+                float(params['pickup_lat']), float(params['pickup_lon']), float(params['drop_lat']),
+                float(params['drop_lon']), params['pickup_time_utc'])}
+        if method == 'predict_combined_address' and worker.geocoder is not None:
+            return {'id': request_id, 'result': await predictor.predict_combined_address(
+                params['pickup_address'], params['dropoff_address'], params['pickup_time_utc'],
+                time_budget_ms=params.get('time_budget_ms'))}
+        if method == 'predict_coordinates_hybrid' and worker.geocoder is not None and not params.get('include_metadata'):
+            return {'id': request_id, 'result': await predictor.geocode_many(list(params['addresses']),
+                                                                             params.get('time_budget_ms'))}
+        if method == 'micro_batch_stats':
+            return {'id': request_id, 'result': predictor.stats()}
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        return {'id': request_id, 'error': str(e)}
+    # Everything else runs as before, on the model thread so it never overlaps a batch
+    return await asyncio.get_running_loop().run_in_executor(predictor.executor, worker.handle, request)
+
+async def _serve_micro_batched(worker, stdin, stdout, max_wait_ms: float, max_items: int, coalesce: bool) -> None:
+    from prediction_worker import _json_default
+    loop = asyncio.get_running_loop()
+    predictor = MicroBatchingPredictor(worker.geocoder, worker.eta_model, worker.distance_model,
+                                       max_wait_ms=max_wait_ms, max_items=max_items, coalesce=coalesce)
+    stdin_reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stdin')
+    in_flight = set()
+
+    def write(message):
+        stdout.write(json.dumps(message, default=_json_default) + '\n')
+        stdout.flush()
+
+    async def answer(request):
+        write(await handle_micro_batched(worker, predictor, request))
+
+    write({'event': 'ready'})
+    while True:
+        line = await loop.run_in_executor(stdin_reader, stdin.readline)
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write({'id': None, 'error': f"Invalid JSON request: {e}"})
+            continue
+        # Responses go out as they complete; callers match them to requests by id
+        task = asyncio.ensure_future(answer(request))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    stdin_reader.shutdown(wait=False)
+    predictor.executor.shutdown(wait=True)
+
+def serve_micro_batched(worker, stdin, stdout, max_wait_ms: float = 2.0, max_items: int = 64, coalesce: bool = True) -> None:
+    """prediction_worker.serve, answering concurrent requests out of order from shared batches"""
+    asyncio.run(_serve_micro_batched(worker, stdin, stdout, max_wait_ms, max_items, coalesce))
+
+def _latency_summary(mode: str, latencies: List[float], seconds: float, extra: Optional[Dict] = None) -> Dict:
+    import numpy as np
+    latencies_ms = np.array(latencies) * 1000.0
+    summary = {'mode': mode, 'requests': len(latencies), 'seconds': seconds,
+               'requests_per_second': len(latencies) / seconds if seconds > 0 else 0.0,
+               'p50_ms': float(np.percentile(latencies_ms, 50)), 'p99_ms': float(np.percentile(latencies_ms, 99))}
+    summary.update(extra or {})
+    return summary
+
+async def _closed_loop(call, requests: List, concurrency: int):
+    """Run `requests` with `concurrency` clients that each send their next request when the last returns"""
+    queue = list(reversed(requests))
+    latencies = []
+
+    async def client():
+        while queue:
+            request = queue.pop()
+            started = time.perf_counter()
+            await call(request)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+def benchmark_micro_batching(geocoder, eta_model, distance_model=None, requests: Optional[List] = None,
+                             concurrency: int = 32, max_wait_ms: float = 2.0, max_items: int = 64,
+                             n_requests: int = 2000) -> List[Dict]:
+    """p50/p99 latency and throughput of predict_combined_address, one request at a time vs micro-batched
+
+    Both modes serve the same closed-loop load of `concurrency` clients. The baseline runs each
+    request alone on one model thread, as the stdin worker does. The two modes get disjoint
+    address sets, so neither is helped by embeddings the other cached.
+    """
+    from geocoder import synthetic_kuwaiti_addresses
+    from simple_combined_address import predict_combined_address
+    if requests is None:
+        import random
+        rng = random.Random(0)
+        addresses = synthetic_kuwaiti_addresses(geocoder, 2 * n_requests, seed=24)
+        requests = [(addresses[2 * i], addresses[2 * i + 1],
+                     f"2024-01-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z")
+                    for i in range(n_requests)]
+    half = len(requests) // 2
+    baseline_requests, batched_requests = requests[:half], requests[half:]
+
+    async def run():
+        model_thread = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+
+        async def one_at_a_time(request):
+            return await loop.run_in_executor(model_thread, lambda: predict_combined_address(
+                *request, geocoder=geocoder, eta_model=eta_model, distance_model=distance_model))
+
+        latencies, seconds = await _closed_loop(one_at_a_time, baseline_requests, concurrency)
+        model_thread.shutdown()
+        results = [_latency_summary('one-at-a-time', latencies, seconds)]
+        predictor = MicroBatchingPredictor(geocoder, eta_model, distance_model, max_wait_ms=max_wait_ms, max_items=max_items)
+        latencies, seconds = await _closed_loop(lambda request: predictor.predict_combined_address(*request),
+                                                batched_requests, concurrency)
+        predictor.executor.shutdown()
+        stats = predictor.stats()
+        results.append(_latency_summary('micro-batched', latencies, seconds,
+                                        {'mean_address_batch': stats['addresses']['mean_batch_size'],
+                                         'mean_trip_batch': stats['trips']['mean_batch_size'],
+                                         'coalesced_fraction': stats['coalesced']['shared_fraction']}))
+        return results
+
+    results = asyncio.run(run())
+    print(f"{'mode':<14} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in results:
+        print(f"{row['mode']:<14} {row['requests']:>8} {row['requests_per_second']:>8.1f} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+    batched = results[-1]
+    print(f"Mean batch: {batched['mean_address_batch']:.1f} addresses, {batched['mean_trip_batch']:.1f} trips, "
+          f"{batched['coalesced_fraction']:.0%} of calls coalesced ({concurrency} clients, max wait {max_wait_ms} ms, "
+          f"max batch {max_items})")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching front end tools")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    benchmark_parser = subcommands.add_parser('benchmark', help="Latency and throughput against one request at a time")
+    benchmark_parser.add_argument('--models-dir', default=os.path.join(os.path.dirname(os.path.dirname(script_dir)), 'models'))
+    benchmark_parser.add_argument('--eta-model', default=None)
+    benchmark_parser.add_argument('--requests', type=int, default=2000)
+    benchmark_parser.add_argument('--concurrency', type=int, default=32)
+    benchmark_parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    benchmark_parser.add_argument('--max-batch', type=int, default=64)
+    args = parser.parse_args()
+    from geocoder import FixedHybridGeocoder
+    from predict_eta import load_eta_model
+    benchmark_micro_batching(FixedHybridGeocoder.get_instance(models_dir=args.models_dir, warm_up=True),
+                             load_eta_model(args.eta_model), concurrency=args.concurrency, max_wait_ms=args.max_wait_ms,
+                             max_items=args.max_batch, n_requests=args.requests)
@@ -5,9 +5,8 @@ Usage: python predict_combined.py pickup_lat pickup_lon drop_lat drop_lon pickup
 """
 
 import sys
-import json
 import os
-import subprocess
+import json
 from datetime import datetime, timezone, timedelta
 import math
 
@@ -32,50 +31,87 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     
     return R * c
 
-def predict_eta_distance(pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_time_utc_str):
-    """Prediction using coordinate-based ETA script and distance calculation"""
+def build_result(distance_meters, eta_minutes, pickup_lat, pickup_lon, drop_lat, drop_lon,
+                 pickup_time_gcc, day_of_week, hour_of_day):
+    """Shape the combined prediction response returned to the Node service"""
+    return {
+        "distance_meters": round(distance_meters, 2),
+        "estimated_eta_minutes": round(eta_minutes, 2),
+        "pickup_lat": pickup_lat,
+        "pickup_lon": pickup_lon,
+        "drop_lat": drop_lat,
+        "drop_lon": drop_lon,
+        "pickup_local_time": pickup_time_gcc.isoformat(),
+        "day_of_week": day_of_week,
+        "hour_of_day": hour_of_day
+    }
+
+def gcc_pickup_time(pickup_time_utc_str):
+    """(GCC local pickup time, day name, hour) for an ISO-8601 UTC timestamp"""
+    pickup_time_utc = datetime.fromisoformat(pickup_time_utc_str.replace('Z', '+00:00'))
+    # Convert to GCC timezone (UTC+3)
+    pickup_time_gcc = pickup_time_utc.astimezone(timezone(timedelta(hours=3)))
+    return pickup_time_gcc, pickup_time_gcc.strftime("%A"), pickup_time_gcc.hour
+
+def load_distance_model(model_path=None):
+    """Distance model at model_path or $DISTANCE_MODEL_PATH, or None to use Haversine
+
+    The resident worker and the one-shot scripts both resolve the model here, so switching
+    PYTHON_WORKER_ENABLED never changes where distances come from.
+    """
+    model_path = model_path or os.environ.get('DISTANCE_MODEL_PATH')
+    if not model_path:
+        return None
+    import joblib
+    return joblib.load(model_path)
+
+def estimate_distance(pickup_lat, pickup_lon, drop_lat, drop_lon, distance_model=None):
+    """Distance in meters from the distance model when loaded, else Haversine"""
+    if distance_model is None:
+        return calculate_distance(pickup_lat, pickup_lon, drop_lat, drop_lon)
+    import pandas as pd
+    distance_df = pd.DataFrame({
+        "pickup_lat": [pickup_lat],
+        "pickup_lon": [pickup_lon],
+        "drop_lat": [drop_lat],
+        "drop_lon": [drop_lon]
+    })
+    return float(distance_model.predict(distance_df)[0])
+
+def estimate_distance_batch(trips, distance_model=None):
+    """estimate_distance for many (pickup_lat, pickup_lon, drop_lat, drop_lon) trips, one model call for all"""
+    if distance_model is None or not trips:
+        return [calculate_distance(*trip) for trip in trips]
+    import pandas as pd
+    distance_df = pd.DataFrame(list(trips), columns=["pickup_lat", "pickup_lon", "drop_lat", "drop_lon"])
+    return [float(distance) for distance in distance_model.predict(distance_df)]
+
+def predict_eta_distance(pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_time_utc_str,
+                         eta_model=None, distance_model=None):
+    """Prediction using the LightGBM ETA model and distance calculation
+
+    ``eta_model`` is an already loaded booster, as held by the resident
+    prediction worker; without one the booster is loaded here, in-process.
+    """
     try:
         # Parse time to get day of week and hour
-        pickup_time_utc = datetime.fromisoformat(pickup_time_utc_str.replace('Z', '+00:00'))
-        # Convert to GCC timezone (UTC+3)
-        gcc_tz = timezone(timedelta(hours=3))
-        pickup_time_gcc = pickup_time_utc.astimezone(gcc_tz)
-        
-        day_of_week = pickup_time_gcc.strftime("%A")
-        hour_of_day = pickup_time_gcc.hour
-        
-        # Calculate distance using Haversine formula
-        distance_meters = calculate_distance(pickup_lat, pickup_lon, drop_lat, drop_lon)
+        pickup_time_gcc, day_of_week, hour_of_day = gcc_pickup_time(pickup_time_utc_str)
         
-        # Get script directory
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        eta_script = os.path.join(script_dir, "predict_eta.py")
+        # Calculate distance using Haversine formula (or the distance model when loaded)
+        distance_meters = estimate_distance(pickup_lat, pickup_lon, drop_lat, drop_lon, distance_model)
         
-        # Call the ETA prediction script
-        result = subprocess.run([
-            sys.executable, eta_script,
-            str(pickup_lat), str(pickup_lon),
-            str(drop_lat), str(drop_lon),
-            str(hour_of_day), day_of_week
-        ], capture_output=True, text=True, encoding='utf-8')
-        
-        if result.returncode == 0:
-            # Parse the output to get ETA
-            eta_minutes = float(result.stdout.strip())
-            
-            return {
-                "distance_meters": round(distance_meters, 2),
-                "estimated_eta_minutes": round(eta_minutes, 2),
-                "pickup_lat": pickup_lat,
-                "pickup_lon": pickup_lon,
-                "drop_lat": drop_lat,
-                "drop_lon": drop_lon,
-                "pickup_local_time": pickup_time_gcc.isoformat(),
-                "day_of_week": day_of_week,
-                "hour_of_day": hour_of_day
-            }
-        
-        raise Exception(f"ETA script failed: {result.stderr}")
+        # predict_eta pulls in LightGBM, so it is only imported once a prediction is needed
+        from predict_eta import load_eta_model, predict_eta
+        if eta_model is None:
+            eta_model = load_eta_model()
+        eta_minutes = float(predict_eta(
+            eta_model, pickup_lat, pickup_lon, drop_lat, drop_lon,
+            hour_of_day, day_of_week
+        ))
+        return build_result(
+            distance_meters, eta_minutes, pickup_lat, pickup_lon,
+            drop_lat, drop_lon, pickup_time_gcc, day_of_week, hour_of_day
+        )
         
     except Exception as e:
         raise Exception(f"Prediction failed: {str(e)}")
@@ -100,7 +136,8 @@ def main():
             pickup_lon=pickup_lon,
             drop_lat=drop_lat,
             drop_lon=drop_lon,
-            pickup_time_utc_str=pickup_time_utc
+            pickup_time_utc_str=pickup_time_utc,
+            distance_model=load_distance_model()
         )
         
         # Print the result as JSON
@@ -6,22 +6,61 @@ Usage: python predict_eta.py pickup_lat pickup_lon drop_lat drop_lon hour_of_day
 
 import sys
 import os
-import lightgbm as lgb
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-import numpy as np
 
 # Set encoding for Windows compatibility
 if sys.platform.startswith('win'):
     import codecs
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
 
+DAY_OF_WEEK_CLASSES = ['Friday', 'Monday', 'Saturday', 'Sunday', 'Thursday', 'Tuesday', 'Wednesday']
+
+def resolve_model_path():
+    """Locate eta_model.txt in server/src/models, falling back to the server root"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    model_path = os.path.join(os.path.dirname(script_dir), 'models', 'eta_model.txt')
+    if not os.path.exists(model_path):
+        # Fallback to server root directory
+        model_path = os.path.join(os.path.dirname(os.path.dirname(script_dir)), 'eta_model.txt')
+    return model_path
+
+def load_eta_model(model_path=None):
+    """Load the LightGBM ETA booster"""
+    # Imported here so importing this module stays cheap for callers that never load the model
+    import lightgbm as lgb
+    return lgb.Booster(model_file=model_path or resolve_model_path())
+
+def encode_day_of_week(day_of_week):
+    """Label-encode the day name the way the training LabelEncoder did (sorted class index)"""
+    try:
+        return DAY_OF_WEEK_CLASSES.index(day_of_week)
+    except ValueError:
+        raise ValueError(f"y contains previously unseen labels: {day_of_week!r}")
+
+def predict_eta(model, pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week):
+    """Predict delivery duration in minutes with an already loaded model"""
+    import numpy as np
+    # Columns in training order: pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week_encoded
+    input_data = np.array([[
+        pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, encode_day_of_week(day_of_week)
+    ]], dtype=np.float64)
+
+    return model.predict(input_data)[0]
+
+def predict_eta_batch(model, rows):
+    """Predict many trips in one model call; rows are (pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week)"""
+    import numpy as np
+    input_data = np.array([
+        [pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, encode_day_of_week(day_of_week)]
+        for pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week in rows
+    ], dtype=np.float64).reshape(-1, 6)
+    return model.predict(input_data)
+
 def main():
     if len(sys.argv) != 7:
         print("Usage: python predict_eta.py pickup_lat pickup_lon drop_lat drop_lon hour_of_day day_of_week")
         print("Example: python predict_eta.py 29.3759 47.9774 29.3041 48.0764 14 Monday")
         sys.exit(1)
-    
+
     try:
         # Parse arguments
         pickup_lat = float(sys.argv[1])
@@ -30,35 +69,14 @@ def main():
         drop_lon = float(sys.argv[4])
         hour_of_day = int(sys.argv[5])
         day_of_week_input = sys.argv[6]
-        
+
         # Load ETA model
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(os.path.dirname(script_dir), 'models', 'eta_model.txt')
-        if not os.path.exists(model_path):
-            # Fallback to server root directory
-            model_path = os.path.join(os.path.dirname(os.path.dirname(script_dir)), 'eta_model.txt')
-        
-        model = lgb.Booster(model_file=model_path)
-        
-        # Encode day of the week
-        day_encoder = LabelEncoder()
-        day_encoder.classes_ = np.array(['Friday', 'Monday', 'Saturday', 'Sunday', 'Thursday', 'Tuesday', 'Wednesday'])
-        day_of_week_encoded = day_encoder.transform([day_of_week_input])[0]
-        
-        # Build input DataFrame
-        input_data = pd.DataFrame([{
-            "pickup_lat": pickup_lat,
-            "pickup_lon": pickup_lon,
-            "drop_lat": drop_lat,
-            "drop_lon": drop_lon,
-            "hour_of_day": hour_of_day,
-            "day_of_week_encoded": day_of_week_encoded
-        }])
-        
+        model = load_eta_model()
+
         # Predict and print result
-        prediction = model.predict(input_data)[0]
+        prediction = predict_eta(model, pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week_input)
         print(f"{prediction:.2f}")
-        
+
     except Exception as e:
         print(f"Error: {str(e)}")
         sys.exit(1)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Resident Prediction Worker
+Loads the geocoder, the LightGBM ETA model and (optionally) the distance model
+once and serves predictions over JSON lines on stdin/stdout for the life of
+the process, so the Node services no longer pay Python startup and model
+loading on every request.
+
+Usage: python prediction_worker.py [--models-dir DIR] [--eta-model PATH] [--distance-model PATH] [--no-geocoder] [--mmap-artifacts]
+                                   [--embedding-store PATH] [--structured-lookup-std DEG]
+                                   [--knn-tier] [--embedder-backend {torch,onnx,onnx-int8}] [--compiled-trees] [--warm-up]
+                                   [--prefork N --listen HOST:PORT|PATH | --micro-batch-ms MS [--micro-batch-size N] [--no-coalesce]]
+
+Protocol (one JSON object per line):
+  request:  {"id": 1, "method": "predict_eta_distance", "params": {...}}
+  response: {"id": 1, "result": {...}}  or  {"id": 1, "error": "message"}
+Once every model is loaded the worker emits {"event": "ready"}. Responses come back in
+request order, except with --micro-batch-ms, where they are written as they complete.
+"""
+
+import sys
+import os
+import json
+import argparse
+import traceback
+
+# Set encoding for Windows compatibility
+if sys.platform.startswith('win'):
+    import codecs
+    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
+
+# Add path for sibling script imports
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(script_dir)
+
+DEFAULT_MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(script_dir)), 'models')
+
+class PredictionWorker:
+    def __init__(self, models_dir=DEFAULT_MODELS_DIR, eta_model_path=None, distance_model_path=None, load_geocoder=True,
+                 mmap_artifacts=False, embedding_store_path=None, structured_lookup_std=None,
+                 enable_knn_tier=False, embedder_backend='torch', compiled_trees=False, warm_up=False):
+        from predict_eta import load_eta_model
+        from predict_combined import load_distance_model
+        self.models_dir = models_dir
+        self.eta_model = load_eta_model(eta_model_path)
+        self.distance_model = load_distance_model(distance_model_path)
+        self.geocoder = None
+        self.geocoder_error = None
+        if load_geocoder:
+            try:
+                from geocoder import FixedHybridGeocoder
+                self.geocoder = FixedHybridGeocoder.get_instance(models_dir=models_dir, warm_up=warm_up,
+                                                                 mmap_artifacts=mmap_artifacts,
+                                                                 embedding_store_path=embedding_store_path,
+                                                                 structured_lookup_std=structured_lookup_std,
+                                                                 enable_knn_tier=enable_knn_tier,
+                                                                 embedder_backend=embedder_backend,
+                                                                 compiled_trees=compiled_trees)
+            except Exception as e:
+                # Coordinate-based requests remain servable without the geocoder
+                self.geocoder_error = str(e)
+                print(f"Warning: Could not load geocoder: {e}", file=sys.stderr)
+        self.methods = {
+            'ping': self.ping,
+            'memory_report': self.memory_report,
+            'cache_stats': self.cache_stats,
+            'tier_stats': self.tier_stats,
+            'predict_eta': self.predict_eta,
+            'predict_eta_distance': self.predict_eta_distance,
+            'predict_coordinates_hybrid': self.predict_coordinates_hybrid,
+            'predict_combined_address': self.predict_combined_address,
+        }
+
+    def _require_geocoder(self):
+        if self.geocoder is None:
+            raise RuntimeError(f"Geocoder is not loaded in this worker: {self.geocoder_error or 'disabled'}")
+        return self.geocoder
+
+    def ping(self, params):
+        return {'pid': os.getpid(), 'geocoder_loaded': self.geocoder is not None}
+
+    def memory_report(self, params):
+        hybrid_model = self._require_geocoder().artifacts['hybrid_model']
+        return hybrid_model.artifact_memory_report()
+
+    def cache_stats(self, params):
+        return self._require_geocoder().cache_stats()
+
+    def tier_stats(self, params):
+        return self._require_geocoder().tier_stats()
+
+    def predict_eta(self, params):
+        from predict_eta import predict_eta
+        prediction = predict_eta(
+            self.eta_model,
+            float(params['pickup_lat']), float(params['pickup_lon']),
+            float(params['drop_lat']), float(params['drop_lon']),
+            int(params['hour_of_day']), params['day_of_week']
+        )
+        return {'estimated_eta_minutes': round(float(prediction), 2)}
+
+    def predict_eta_distance(self, params):
+        from predict_combined import predict_eta_distance
+        return predict_eta_distance(
+            float(params['pickup_lat']), float(params['pickup_lon']),
+            float(params['drop_lat']), float(params['drop_lon']),
+            params['pickup_time_utc'],
+            eta_model=self.eta_model, distance_model=self.distance_model
+        )
+
+    def predict_coordinates_hybrid(self, params):
+        if not params.get('include_metadata'):
+            return self._require_geocoder().predict_coordinates_hybrid(list(params['addresses']),
+                                                                       time_budget_ms=params.get('time_budget_ms'))
+        metadata = {}
+        results = self._require_geocoder().predict_coordinates_hybrid(list(params['addresses']),
+                                                                      time_budget_ms=params.get('time_budget_ms'),
+                                                                      metadata=metadata)
+        return {'results': results, 'metadata': metadata}
+
+    def predict_combined_address(self, params):
+        from simple_combined_address import predict_combined_address
+        return predict_combined_address(
+            params['pickup_address'], params['dropoff_address'], params['pickup_time_utc'],
+            geocoder=self._require_geocoder(), eta_model=self.eta_model,
+            distance_model=self.distance_model, time_budget_ms=params.get('time_budget_ms')
+        )
+
+    def handle(self, request):
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            method = self.methods.get(request.get('method'))
+            if method is None:
+                raise ValueError(f"Unknown method: {request.get('method')}")
+            return {'id': request_id, 'result': method(request.get('params') or {})}
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            return {'id': request_id, 'error': str(e)}
+
+def _json_default(value):
+    # NumPy scalars and arrays leak out of the geocoder results
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def serve(worker, stdin, stdout):
+    """Answer JSON-line requests from ``stdin`` on ``stdout`` until EOF"""
+    def write(message):
+        stdout.write(json.dumps(message, default=_json_default) + '\n')
+        stdout.flush()
+
+    write({'event': 'ready'})
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write({'id': None, 'error': f"Invalid JSON request: {e}"})
+            continue
+        write(worker.handle(request))
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident geocoding/ETA prediction worker")
+    parser.add_argument('--models-dir', default=os.environ.get('GEOCODER_MODELS_DIR', DEFAULT_MODELS_DIR))
+    parser.add_argument('--eta-model', default=os.environ.get('ETA_MODEL_PATH'))
+    parser.add_argument('--distance-model', default=os.environ.get('DISTANCE_MODEL_PATH'),
+                        help="Distance model (default: DISTANCE_MODEL_PATH, which the one-shot scripts read too; "
+                             "set it there rather than in PYTHON_WORKER_ARGS so both paths agree)")
+    parser.add_argument('--no-geocoder', action='store_true', help="Serve coordinate-based requests only")
+    parser.add_argument('--mmap-artifacts', action='store_true',
+                        default=os.environ.get('GEOCODER_MMAP_ARTIFACTS', '').lower() in ('1', 'true'),
+                        help="Map the FAISS index and reference arrays read-only so workers share them")
+    parser.add_argument('--embedding-store', default=os.environ.get('GEOCODER_EMBEDDING_STORE'),
+                        help="SQLite file of address embeddings shared across restarts and workers")
+    parser.add_argument('--structured-lookup-std', type=float,
+                        default=float(os.environ['GEOCODER_STRUCTURED_LOOKUP_STD'])
+                        if os.environ.get('GEOCODER_STRUCTURED_LOOKUP_STD') else None,
+                        help="Answer geo_stats blocks and streets whose lat/lon std is at most this (degrees) without the models")
+    parser.add_argument('--knn-tier', action='store_true',
+                        default=os.environ.get('GEOCODER_KNN_TIER', '').lower() in ('1', 'true'),
+                        help="Try an embedding-free kNN over the reference set before the full model "
+                             "(at load, runs XGBoost over every reference row and builds an in-memory FAISS index)")
+    parser.add_argument('--embedder-backend', choices=('torch', 'onnx', 'onnx-int8'),
+                        default=os.environ.get('GEOCODER_EMBEDDER_BACKEND', 'torch'),
+                        help="Run the sentence embedder on PyTorch or on ONNX Runtime (fp32 or int8)")
+    parser.add_argument('--compiled-trees', action='store_true',
+                        default=os.environ.get('GEOCODER_COMPILED_TREES', '').lower() in ('1', 'true'),
+                        help="Predict small geocoding batches with the flattened XGBoost trees")
+    parser.add_argument('--warm-up', action='store_true',
+                        default=os.environ.get('GEOCODER_WARM_UP', '').lower() in ('1', 'true'),
+                        help="Geocode a small batch at startup so the first request skips cold-start costs")
+    parser.add_argument('--prefork', type=int, default=int(os.environ.get('PREDICTION_WORKER_PREFORK', '0')),
+                        help="Load once, then fork this many workers serving --listen (see prefork_server.py)")
+    parser.add_argument('--listen', default=os.environ.get('PREDICTION_WORKER_LISTEN', '127.0.0.1:8765'),
+                        help="HOST:PORT or Unix socket path the pre-forked workers accept connections on")
+    parser.add_argument('--micro-batch-ms', type=float, default=float(os.environ['PREDICTION_WORKER_MICRO_BATCH_MS'])
+                        if os.environ.get('PREDICTION_WORKER_MICRO_BATCH_MS') else None,
+                        help="Answer concurrent stdin requests from shared batches, waiting up to this long for one to fill")
+    parser.add_argument('--micro-batch-size', type=int, default=int(os.environ.get('PREDICTION_WORKER_MICRO_BATCH_SIZE', '64')),
+                        help="Largest micro-batch of addresses or trips")
+    parser.add_argument('--no-coalesce', action='store_true',
+                        default=os.environ.get('PREDICTION_WORKER_COALESCE', '').lower() in ('0', 'false'),
+                        help="With --micro-batch-ms, compute identical in-flight requests separately")
+    args = parser.parse_args()
+
+    # stdout carries the protocol; anything the models print goes to stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    if args.prefork:
+        import gc
+        # No collections while loading, so nothing is freed from pages the forked workers will share
+        gc.disable()
+
+    try:
+        worker = PredictionWorker(
+            models_dir=args.models_dir,
+            eta_model_path=args.eta_model,
+            distance_model_path=args.distance_model,
+            load_geocoder=not args.no_geocoder,
+            mmap_artifacts=args.mmap_artifacts,
+            embedding_store_path=args.embedding_store,
+            structured_lookup_std=args.structured_lookup_std,
+            enable_knn_tier=args.knn_tier,
+            embedder_backend=args.embedder_backend,
+            compiled_trees=args.compiled_trees,
+            warm_up=args.warm_up
+        )
+    except Exception as e:
+        print(f"Error loading prediction worker: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.prefork:
+        from prefork_server import run_prefork_server
+        run_prefork_server(worker, args.listen, args.prefork, ready_out=protocol_out)
+    elif args.micro_batch_ms is not None:
+        from micro_batching import serve_micro_batched
+        serve_micro_batched(worker, sys.stdin, protocol_out, max_wait_ms=args.micro_batch_ms, max_items=args.micro_batch_size,
+                            coalesce=not args.no_coalesce)
+    else:
+        serve(worker, sys.stdin, protocol_out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Pre-fork prediction server
+
+Loads the geocoder and the ETA/distance models once in a parent process, moves every
+object it allocated into the collector's permanent generation (gc.freeze) and forks
+worker processes that accept connections on one shared listening socket. Each child
+starts with a copy-on-write view of the parent's memory: model arrays, the FAISS index
+and the embedder weights stay shared until written, and frozen objects are never
+traversed by the collector, so collections in a child do not dirty their pages.
+Reference counting still copies the pages of Python objects a child touches, which is
+what the memory measurement below shows.
+
+Each connection speaks the prediction_worker.py JSON-line protocol and is served by one
+child until it closes. Linux only (fork, /proc).
+
+Usage: python prediction_worker.py --prefork N --listen 127.0.0.1:8765 [worker options]
+       python prefork_server.py measure --workers N [worker options]
+"""
+
+import sys
+import os
+import gc
+import json
+import time
+import signal
+import socket
+import argparse
+import traceback
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+WORKER_SCRIPT = os.path.join(script_dir, 'prediction_worker.py')
+
+# Requests each worker answers before its memory is read, so lazily built state is counted
+MEASURE_REQUESTS = [
+    {'method': 'ping', 'params': {}},
+    {'method': 'predict_eta', 'params': {'pickup_lat': 29.3492, 'pickup_lon': 48.0953, 'drop_lat': 29.3413,
+                                         'drop_lon': 48.0198, 'hour_of_day': 14, 'day_of_week': 'Wednesday'}},
+    {'method': 'predict_coordinates_hybrid', 'params': {'addresses': ['Salmiya, Block 1, Street 1',
+                                                                      'Hawalli, Block 4, tunis street']}},
+]
+
+def parse_listen_address(listen: str) -> Tuple[int, object]:
+    """'HOST:PORT' is a TCP address; anything containing a path separator is a Unix socket path"""
+    if os.sep in listen or ':' not in listen:
+        return socket.AF_UNIX, listen
+    host, port = listen.rsplit(':', 1)
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+def open_listener(listen: str, backlog: int = 128) -> socket.socket:
+    family, address = parse_listen_address(listen)
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.unlink(address)
+    else:
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(address)
+    listener.listen(backlog)
+    return listener
+
+def _limit_threads(threads: int) -> None:
+    # Thread pools already initialized in the parent ignore OMP_NUM_THREADS, so set them directly
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(threads)
+    if 'faiss' in sys.modules:
+        sys.modules['faiss'].omp_set_num_threads(threads)
+
+def _child_main(worker, listener: socket.socket, threads: int) -> None:
+    from prediction_worker import serve
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    _limit_threads(threads)
+    while True:
+        connection, _ = listener.accept()
+        with connection:
+            try:
+                serve(worker, connection.makefile('r', encoding='utf-8'), connection.makefile('w', encoding='utf-8'))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+# A worker that dies sooner than this after starting doubles the delay before the next restart
+RESTART_MIN_UPTIME = 10.0
+RESTART_BACKOFF_INITIAL = 0.5
+RESTART_BACKOFF_MAX = 30.0
+
+def run_prefork_server(worker, listen: str, workers: int, threads_per_worker: Optional[int] = None,
+                       ready_out=None) -> None:
+    """Fork `workers` children serving `worker` on `listen` and restart any that exit, until SIGTERM/SIGINT
+
+    Call gc.disable() before loading the models so no collection frees objects in the middle
+    of pages the children will share. Every fork is preceded by gc.freeze(), the children
+    re-enable gc, and the parent re-enables it once the first workers are running: it then
+    only reaps and restarts children, and frozen objects are never collected. Workers that
+    keep dying early are restarted after an exponential backoff (RESTART_BACKOFF_*).
+    """
+    listener = open_listener(listen)
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    children = {}
+    stopping = False
+    restart_delay = 0.0
+
+    def spawn():
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _child_main(worker, listener, threads)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                # _child_main only returns by raising, so any exit here is a failure
+                os._exit(1)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for _ in range(workers):
+        spawn()
+    gc.enable()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    address = listener.getsockname()
+    listening = f"{address[0]}:{address[1]}" if isinstance(address, tuple) else address
+    print(f"Serving on {listening} with {workers} workers", file=sys.stderr)
+    if ready_out is not None:
+        ready_out.write(json.dumps({'event': 'ready', 'listen': listening, 'workers': sorted(children)}) + '\n')
+        ready_out.flush()
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = children.pop(pid, None)
+            if stopping:
+                continue
+            if started is not None and time.monotonic() - started < RESTART_MIN_UPTIME:
+                restart_delay = min(max(2 * restart_delay, RESTART_BACKOFF_INITIAL), RESTART_BACKOFF_MAX)
+            else:
+                restart_delay = 0.0
+            print(f"Worker {pid} exited with status {status}; restarting in {restart_delay:.1f} s", file=sys.stderr)
+            deadline = time.monotonic() + restart_delay
+            while not stopping and time.monotonic() < deadline:
+                time.sleep(min(0.1, deadline - time.monotonic()))
+            if not stopping:
+                spawn()
+    finally:
+        listener.close()
+        if listener.family == socket.AF_UNIX and os.path.exists(listening):
+            os.unlink(listening)
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """RSS, PSS and unique (private) memory of a process in MB, from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024.0
+    return {
+        'rss_mb': fields.get('Rss', 0.0),
+        'pss_mb': fields.get('Pss', 0.0),
+        'uss_mb': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0)
+    }
+
+def _read_ready(stream) -> Dict:
+    for line in stream:
+        message = json.loads(line)
+        if message.get('event') == 'ready':
+            return message
+    raise RuntimeError("Worker exited before it was ready")
+
+def _exchange(reader, writer, requests: List[Dict]) -> None:
+    for request_id, request in enumerate(requests, 1):
+        writer.write(json.dumps(dict(request, id=request_id)) + '\n')
+        writer.flush()
+        while 'id' not in json.loads(reader.readline()):
+            pass
+
+def _summarize(label: str, worker_memory: List[Dict[str, float]], parent_memory: Optional[Dict[str, float]] = None) -> Dict:
+    total_pss = sum(memory['pss_mb'] for memory in worker_memory) + (parent_memory['pss_mb'] if parent_memory else 0.0)
+    return {
+        'mode': label,
+        'workers': len(worker_memory),
+        'worker_rss_mb': sum(memory['rss_mb'] for memory in worker_memory) / len(worker_memory),
+        'worker_uss_mb': sum(memory['uss_mb'] for memory in worker_memory) / len(worker_memory),
+        'parent_pss_mb': parent_memory['pss_mb'] if parent_memory else 0.0,
+        'total_pss_mb': total_pss
+    }
+
+def measure_prefork_memory(workers: int, worker_args: List[str], requests: Optional[List[Dict]] = None) -> List[Dict]:
+    """Per-worker unique memory of `workers` independently loaded workers versus a pre-fork pool
+
+    Every worker answers `requests` (default MEASURE_REQUESTS, less the geocoder request with
+    --no-geocoder; errors are fine, the point is to touch the models) before /proc is read. USS is memory only that worker holds; total PSS
+    charges shared pages proportionally, so it is what the pool costs the machine.
+    """
+    if requests is None:
+        requests = [request for request in MEASURE_REQUESTS
+                    if '--no-geocoder' not in worker_args or request['method'] != 'predict_coordinates_hybrid']
+    results = []
+    processes = [subprocess.Popen([sys.executable, WORKER_SCRIPT] + worker_args, stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+    try:
+        for process in processes:
+            _read_ready(process.stdout)
+            _exchange(process.stdout, process.stdin, requests)
+        results.append(_summarize('independent', [process_memory(process.pid) for process in processes]))
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    server = subprocess.Popen([sys.executable, WORKER_SCRIPT, '--prefork', str(workers), '--listen', '127.0.0.1:0'] + worker_args,
+                              stdout=subprocess.PIPE, text=True)
+    connections = []
+    try:
+        ready = _read_ready(server.stdout)
+        family, address = parse_listen_address(ready['listen'])
+        # Holding every connection open keeps each child busy with one, so all of them are measured
+        for _ in range(workers):
+            connection = socket.create_connection(address)
+            reader, writer = connection.makefile('r', encoding='utf-8'), connection.makefile('w', encoding='utf-8')
+            _read_ready(reader)
+            connections.append((connection, reader, writer))
+        for connection, reader, writer in connections:
+            _exchange(reader, writer, requests)
+        results.append(_summarize('prefork', [process_memory(pid) for pid in ready['workers']], process_memory(server.pid)))
+    finally:
+        for connection, reader, writer in connections:
+            connection.close()
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+    print(f"{'mode':<12} {'workers':>7} {'worker RSS MB':>14} {'worker USS MB':>14} {'parent PSS MB':>14} {'total PSS MB':>13}")
+    for row in results:
+        print(f"{row['mode']:<12} {row['workers']:>7} {row['worker_rss_mb']:>14.1f} {row['worker_uss_mb']:>14.1f} "
+              f"{row['parent_pss_mb']:>14.1f} {row['total_pss_mb']:>13.1f}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-fork prediction server tools")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    measure_parser = subcommands.add_parser('measure', help="Compare worker memory: independent loading vs pre-fork")
+    measure_parser.add_argument('--workers', type=int, default=4)
+    args, worker_args = parser.parse_known_args()
+    started = time.perf_counter()
+    measure_prefork_memory(args.workers, worker_args)
+    print(f"Measured in {time.perf_counter() - started:.1f} s", file=sys.stderr)
@@ -3,10 +3,6 @@
 import sys
 import json
 import os
-import lightgbm as lgb
-import pandas as pd
-from sklearn.preprocessing import LabelEncoder
-import numpy as np
 from datetime import datetime, timezone, timedelta
 import math
 
@@ -34,50 +30,30 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     
     return R * c
 
-def predict_eta_lightweight(pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week):
+def predict_eta_lightweight(pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week, model=None):
     """Lightweight ETA prediction using LightGBM model"""
     try:
-        # Load ETA model
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(os.path.dirname(script_dir), 'models', 'eta_model.txt')
-        if not os.path.exists(model_path):
-            # Fallback to server root directory
-            model_path = os.path.join(os.path.dirname(os.path.dirname(script_dir)), 'eta_model.txt')
+        from predict_eta import load_eta_model, predict_eta
+        # Load ETA model unless the caller already holds one
+        if model is None:
+            model = load_eta_model()
         
-        model = lgb.Booster(model_file=model_path)
-        
-        # Encode day of the week
-        day_encoder = LabelEncoder()
-        day_encoder.classes_ = np.array(['Friday', 'Monday', 'Saturday', 'Sunday', 'Thursday', 'Tuesday', 'Wednesday'])
-        day_of_week_encoded = day_encoder.transform([day_of_week])[0]
-        
-        # Build input DataFrame
-        input_data = pd.DataFrame([{
-            "pickup_lat": pickup_lat,
-            "pickup_lon": pickup_lon,
-            "drop_lat": drop_lat,
-            "drop_lon": drop_lon,
-            "hour_of_day": hour_of_day,
-            "day_of_week_encoded": day_of_week_encoded
-        }])
-        
-        # Predict
-        prediction = model.predict(input_data)[0]
-        return prediction
+        return predict_eta(model, pickup_lat, pickup_lon, drop_lat, drop_lon, hour_of_day, day_of_week)
         
     except Exception as e:
         raise Exception(f"ETA prediction failed: {str(e)}")
 
-def enhanced_geocode(addresses):
+def enhanced_geocode(addresses, geocoder=None, time_budget_ms=None):
     """
     Enhanced geocoding function using the cached FixedHybridGeocoder instance
     """
-    from geocoder import FixedHybridGeocoder
-    # Correct path to models directory: server/models
-    models_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'models')
-    # Use cached instance for better performance
-    geocoder = FixedHybridGeocoder.get_instance(models_dir=models_dir)
-    results = geocoder.predict_coordinates_hybrid(addresses)
+    if geocoder is None:
+        from geocoder import FixedHybridGeocoder
+        # Correct path to models directory: server/models
+        models_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'models')
+        # Use cached instance for better performance
+        geocoder = FixedHybridGeocoder.get_instance(models_dir=models_dir)
+    results = geocoder.predict_coordinates_hybrid(addresses, time_budget_ms=time_budget_ms)
     return results
 
 def simple_geocode_fallback(addresses):
@@ -148,11 +124,13 @@ def simple_geocode_fallback(addresses):
     
     return results
 
-def predict_combined_address(pickup_address, dropoff_address, pickup_time_utc_str):
+def predict_combined_address(pickup_address, dropoff_address, pickup_time_utc_str,
+                             geocoder=None, eta_model=None, distance_model=None, time_budget_ms=None):
     """Combined prediction using addresses with enhanced geocoding"""
     try:
         # Use enhanced geocoding for high accuracy
-        geocoding_results = enhanced_geocode([pickup_address, dropoff_address])
+        geocoding_results = enhanced_geocode([pickup_address, dropoff_address], geocoder=geocoder,
+                                             time_budget_ms=time_budget_ms)
         
         pickup_result = geocoding_results[0]
         dropoff_result = geocoding_results[1]
@@ -171,13 +149,14 @@ def predict_combined_address(pickup_address, dropoff_address, pickup_time_utc_st
         day_of_week = pickup_time_gcc.strftime("%A")
         hour_of_day = pickup_time_gcc.hour
         
-        # Calculate distance using Haversine formula
-        distance_meters = calculate_distance(pickup_lat, pickup_lon, drop_lat, drop_lon)
+        # Calculate distance using Haversine formula (or the distance model when loaded)
+        from predict_combined import estimate_distance
+        distance_meters = estimate_distance(pickup_lat, pickup_lon, drop_lat, drop_lon, distance_model)
         
         # Predict ETA using lightweight method
         eta_minutes = predict_eta_lightweight(
             pickup_lat, pickup_lon, drop_lat, drop_lon, 
-            hour_of_day, day_of_week
+            hour_of_day, day_of_week, model=eta_model
         )
         
         return {
@@ -199,28 +178,34 @@ def predict_combined_address(pickup_address, dropoff_address, pickup_time_utc_st
     except Exception as e:
         raise Exception(f"Address-based prediction failed: {str(e)}")
 
-# Check if we have the correct number of arguments
-if len(sys.argv) != 4:
-    print("Error: Incorrect number of arguments")
-    print("Usage: python simple_combined_address.py pickup_address dropoff_address pickup_time_utc")
-    sys.exit(1)
+def main():
+    # Check if we have the correct number of arguments
+    if len(sys.argv) != 4:
+        print("Error: Incorrect number of arguments")
+        print("Usage: python simple_combined_address.py pickup_address dropoff_address pickup_time_utc")
+        sys.exit(1)
 
-try:
-    # Parse arguments
-    pickup_address = sys.argv[1]
-    dropoff_address = sys.argv[2]
-    pickup_time_utc = sys.argv[3]  # ISO 8601 format string
+    try:
+        from predict_combined import load_distance_model
+        # Parse arguments
+        pickup_address = sys.argv[1]
+        dropoff_address = sys.argv[2]
+        pickup_time_utc = sys.argv[3]  # ISO 8601 format string
     
-    # Call the prediction function
-    result = predict_combined_address(
-        pickup_address=pickup_address,
-        dropoff_address=dropoff_address,
-        pickup_time_utc_str=pickup_time_utc
-    )
+        # Call the prediction function
+        result = predict_combined_address(
+            pickup_address=pickup_address,
+            dropoff_address=dropoff_address,
+            pickup_time_utc_str=pickup_time_utc,
+            distance_model=load_distance_model()
+        )
     
-    # Print the result as JSON
-    print(json.dumps(result))
+        # Print the result as JSON
+        print(json.dumps(result))
     
-except Exception as e:
-    print(f"Error during prediction: {str(e)}", file=sys.stderr)
-    sys.exit(1)
+    except Exception as e:
+        print(f"Error during prediction: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
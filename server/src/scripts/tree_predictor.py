@@ -0,0 +1,185 @@
+"""
+Flattened NumPy evaluator for the geocoder's XGBoost models.
+
+FlatTreeEnsemble copies every tree of a trained booster into a few contiguous
+node arrays, laid out so a split's right child directly follows its left
+child, and walks all trees for a whole batch level by level. A prediction is
+then a handful of vectorized gathers instead of a call into the library's
+generic predictor with its per-call DMatrix/DataFrame conversion, which pays
+off for the single-row and small-batch requests the API serves.
+Numerical splits, missing-value routing and vector (multi-output) leaves are
+supported; categorical splits and non-identity objectives raise ValueError so
+callers keep the library predictor.
+"""
+
+import json
+from typing import List, Optional
+
+import numpy as np
+
+class FlatTreeEnsemble:
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, default_left: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, node_ids: np.ndarray, max_depth: int,
+                 base_score: np.ndarray, chunk_size: int = 1024):
+        """Node arrays over all trees; a row goes to left + 1 unless x <= threshold.
+
+        Leaves point back at themselves (left[leaf] == leaf), which is how the walk detects
+        them. node_ids maps nodes back to the library's numbering.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.node_ids = node_ids
+        self.max_depth = max_depth
+        self.base_score = base_score
+        self.chunk_size = chunk_size
+        self.n_outputs = value.shape[1]
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def _from_nodes(cls, trees: List[dict], n_outputs: int, base_score, dtype):
+        """Lay out per-tree node lists (local child indices, -1 at leaves) breadth-first with adjacent siblings"""
+        n_nodes = sum(len(tree['left']) for tree in trees)
+        feature = np.zeros(n_nodes, dtype=np.intp)
+        threshold = np.full(n_nodes, np.inf, dtype=dtype)
+        left = np.arange(n_nodes, dtype=np.intp)
+        default_left = np.zeros(n_nodes, dtype=bool)
+        value = np.zeros((n_nodes, n_outputs), dtype=dtype)
+        node_ids = np.zeros(n_nodes, dtype=np.intp)
+        roots = np.zeros(len(trees), dtype=np.intp)
+        max_depth = 0
+        position = 0
+        for tree_index, tree in enumerate(trees):
+            roots[tree_index] = position
+            order = [(0, 0)]
+            for local, depth in order:
+                slot = position
+                position += 1
+                node_ids[slot] = local
+                max_depth = max(max_depth, depth)
+                if tree['left'][local] < 0:
+                    value[slot] = tree['value'][local]
+                    continue
+                feature[slot] = tree['feature'][local]
+                threshold[slot] = tree['threshold'][local]
+                default_left[slot] = tree['default_left'][local]
+                # Children are numbered in the order they are queued
+                left[slot] = roots[tree_index] + len(order)
+                order.append((tree['left'][local], depth + 1))
+                order.append((tree['right'][local], depth + 1))
+        return cls(feature, threshold, left, default_left, value, roots, node_ids, max_depth,
+                   np.asarray(base_score, dtype=dtype).reshape(n_outputs))
+
+    @classmethod
+    def from_xgboost(cls, model) -> 'FlatTreeEnsemble':
+        """Flatten an xgboost Booster or XGBRegressor (scalar or multi_output_tree leaves)"""
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        learner = json.loads(booster.save_raw(raw_format='json'))['learner']
+        objective = learner['objective']['name']
+        if objective not in ('reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror', 'reg:quantileerror'):
+            raise ValueError(f"Objective {objective} has a non-identity link; use the library predictor")
+        gbm = learner['gradient_booster']
+        if gbm.get('name') != 'gbtree':
+            raise ValueError(f"Booster type {gbm.get('name')} is not a plain tree ensemble")
+        model_json = gbm['model']
+        n_outputs = max(1, int(learner['learner_model_param'].get('num_target', '1')))
+        base_score = [float(v) for v in learner['learner_model_param']['base_score'].strip('[]').split(',')]
+        if len(base_score) == 1:
+            base_score = base_score * n_outputs
+        trees_json = model_json['trees']
+        best_iteration = booster.attr('best_iteration')
+        if best_iteration is not None:
+            # The sklearn wrapper predicts with the trees up to the best iteration only
+            trees_json = trees_json[:model_json['iteration_indptr'][int(best_iteration) + 1]]
+        trees = []
+        for tree_index, tree in enumerate(trees_json):
+            if any(tree['split_type']):
+                raise ValueError("Categorical splits are not supported by the flattened evaluator")
+            left_children = tree['left_children']
+            leaf_size = int(tree['tree_param'].get('size_leaf_vector', '1') or 1)
+            value = np.zeros((len(left_children), n_outputs))
+            if leaf_size > 1:
+                # Vector-leaf tree: a leaf's right_children entry indexes leaf_weights
+                leaf_weights = np.asarray(tree['leaf_weights'], dtype=np.float64).reshape(-1, leaf_size)
+                for node, child in enumerate(left_children):
+                    if child < 0:
+                        value[node] = leaf_weights[tree['right_children'][node]]
+            else:
+                # Scalar tree: the leaf value sits in split_conditions, added to its target's column
+                target = model_json['tree_info'][tree_index] if n_outputs > 1 else 0
+                for node, child in enumerate(left_children):
+                    if child < 0:
+                        value[node, target] = tree['split_conditions'][node]
+            # XGBoost goes left when float32(x) < threshold, i.e. x <= the next float32 below it
+            thresholds = np.nextafter(np.asarray(tree['split_conditions'], dtype=np.float32), np.float32(-np.inf))
+            trees.append({
+                'feature': tree['split_indices'], 'threshold': thresholds, 'left': left_children,
+                'right': tree['right_children'], 'default_left': tree['default_left'], 'value': value
+            })
+        # XGBoost compares and accumulates in float32
+        return cls._from_nodes(trees, n_outputs, base_score, np.float32)
+
+    def predict(self, X) -> np.ndarray:
+        """Same output shape and dtype as the library predictor: (n,) for one output, (n, n_outputs) otherwise
+
+        Leaf values are added to the base score one tree at a time, in the library's order
+        and precision, so the results match it bit for bit.
+        """
+        X = self._as_input(X)
+        out = np.empty((len(X), self.n_outputs), dtype=self.value.dtype)
+        for start in range(0, len(X), self.chunk_size):
+            node = self._route(X[start:start + self.chunk_size])
+            terms = np.concatenate([np.broadcast_to(self.base_score, (len(node), 1, self.n_outputs)),
+                                    self.value[node]], axis=1)
+            out[start:start + self.chunk_size] = np.cumsum(terms, axis=1)[:, -1]
+        return out[:, 0] if self.n_outputs == 1 else out
+
+    def leaf_indices(self, X) -> np.ndarray:
+        """(n, n_trees) leaf reached in each tree, numbered like the library's pred_leaf"""
+        X = self._as_input(X)
+        out = np.empty((len(X), self.n_trees), dtype=np.intp)
+        for start in range(0, len(X), self.chunk_size):
+            out[start:start + self.chunk_size] = self.node_ids[self._route(X[start:start + self.chunk_size])]
+        return out
+
+    def _as_input(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=self.threshold.dtype)
+        return X.reshape(1, -1) if X.ndim == 1 else X
+
+    def _route(self, X: np.ndarray) -> np.ndarray:
+        """(n, n_trees) global leaf node of every row in every tree"""
+        n_rows, n_features = X.shape
+        flat_X = X.ravel()
+        node = np.tile(self.roots, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        # Only (row, tree) pairs still at a split are stepped, so shallow leaves stop costing work
+        active = np.arange(node.size)
+        for _ in range(self.max_depth):
+            current = node[active]
+            x = flat_X[row_offsets[active] + self.feature[current]]
+            go_right = ~(x <= self.threshold[current])
+            missing = np.isnan(x)
+            if missing.any():
+                go_right[missing] = ~self.default_left[current[missing]]
+            current = self.left[current] + go_right
+            node[active] = current
+            active = active[self.left[current] != current]
+            if not active.size:
+                break
+        return node.reshape(n_rows, self.n_trees)
+
+def compile_model(model) -> Optional[FlatTreeEnsemble]:
+    """Flatten an XGBoost model, or return None when it cannot be flattened"""
+    module = type(model).__module__.split('.')[0]
+    try:
+        if module == 'xgboost':
+            return FlatTreeEnsemble.from_xgboost(model)
+    except ValueError:
+        return None
+    return None
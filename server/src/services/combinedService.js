@@ -6,6 +6,99 @@ const path = require('path');
 const config = require('../config');
 const logger = require('../utils/logger');
 const moment = require('moment-timezone');
+const { callWorker } = require('./pythonWorker');
+
+/**
+ * Run the combined prediction on the resident Python worker
+ * @param {Object} data - Validated request data
+ * @param {boolean} hasAddresses - Whether the request is address-based
+ * @returns {Promise<Object>} - Raw prediction result
+ */
+const runWithWorker = async (data, hasAddresses) => {
+  const { pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_address, dropoff_address, pickup_time_utc } = data;
+  
+  if (hasAddresses) {
+    logger.debug('Running address-based combined prediction on Python worker');
+    return callWorker('predict_combined_address', {
+      pickup_address,
+      dropoff_address,
+      pickup_time_utc,
+      time_budget_ms: config.pythonWorker.geocodeBudgetMs
+    });
+  }
+  
+  logger.debug('Running coordinate-based combined prediction on Python worker');
+  return callWorker('predict_eta_distance', { pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_time_utc });
+};
+
+/**
+ * Run the combined prediction by spawning a one-shot Python script
+ * @param {Object} data - Validated request data
+ * @param {boolean} hasAddresses - Whether the request is address-based
+ * @returns {Promise<Object>} - Raw prediction result
+ */
+const runWithScript = async (data, hasAddresses) => {
+  const { pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_address, dropoff_address, pickup_time_utc } = data;
+  
+  // Use direct child_process execution
+  const { execFile } = require('child_process');
+  let scriptPath, scriptArgs;
+  
+  if (hasAddresses) {
+    // Use simple address-based prediction script
+    scriptPath = path.join(__dirname, '../scripts/simple_combined_address.py');
+    scriptArgs = [scriptPath, pickup_address, dropoff_address, pickup_time_utc];
+    logger.debug(`Running simple address-based combined prediction script: ${scriptPath}`);
+  } else {
+    // Use coordinate-based prediction script
+    scriptPath = path.join(__dirname, '../scripts/predict_combined.py');
+    scriptArgs = [
+      scriptPath,
+      pickup_lat.toString(),
+      pickup_lon.toString(),
+      drop_lat.toString(),
+      drop_lon.toString(),
+      pickup_time_utc
+    ];
+    logger.debug(`Running coordinate-based combined prediction script: ${scriptPath}`);
+  }
+  
+  // Run Python script with model
+  const results = await new Promise((resolve, reject) => {
+    execFile(
+      config.pythonPath, 
+      scriptArgs, 
+      { timeout: config.requestTimeout || 60000 },
+      (err, stdout, stderr) => {
+        if (err) {
+          logger.error('Python script execution error:', err);
+          logger.error('Python stderr:', stderr);
+          return reject(err);
+        }
+        
+        if (stderr) {
+          logger.warn('Python stderr (non-fatal):', stderr);
+        }
+        
+        logger.debug('Python stdout:', stdout);
+        resolve(stdout.trim());
+      }
+    );
+  });
+
+  // Parse the result
+  if (!results) {
+    throw new Error('No prediction result returned');
+  }
+
+  try {
+    // Parse the JSON output from the Python script
+    return JSON.parse(results);
+  } catch (parseError) {
+    logger.error('Error parsing prediction result:', parseError);
+    throw new Error(`Invalid prediction result format: ${parseError.message}`);
+  }
+};
 
 /**
  * Get combined distance and ETA prediction from model
@@ -38,87 +131,32 @@ const predictCombined = async (data) => {
       throw new Error('Missing pickup_time_utc parameter for combined prediction');
     }
 
-    // Use direct child_process execution
-    const { execFile } = require('child_process');
-    let scriptPath, scriptArgs;
-    
-    if (hasAddresses) {
-      // Use simple address-based prediction script
-      scriptPath = path.join(__dirname, '../scripts/simple_combined_address.py');
-      scriptArgs = [scriptPath, pickup_address, dropoff_address, pickup_time_utc];
-      logger.debug(`Running simple address-based combined prediction script: ${scriptPath}`);
-    } else {
-      // Use coordinate-based prediction script
-      scriptPath = path.join(__dirname, '../scripts/predict_combined.py');
-      scriptArgs = [
-        scriptPath,
-        pickup_lat.toString(),
-        pickup_lon.toString(),
-        drop_lat.toString(),
-        drop_lon.toString(),
-        pickup_time_utc
-      ];
-      logger.debug(`Running coordinate-based combined prediction script: ${scriptPath}`);
-    }
-    
-    // Run Python script with model
-    const results = await new Promise((resolve, reject) => {
-      execFile(
-        config.pythonPath, 
-        scriptArgs, 
-        { timeout: config.requestTimeout || 60000 },
-        (err, stdout, stderr) => {
-          if (err) {
-            logger.error('Python script execution error:', err);
-            logger.error('Python stderr:', stderr);
-            return reject(err);
-          }
-          
-          if (stderr) {
-            logger.warn('Python stderr (non-fatal):', stderr);
-          }
-          
-          logger.debug('Python stdout:', stdout);
-          resolve(stdout.trim());
-        }
-      );
-    });
-
-    // Parse the result
-    if (!results) {
-      throw new Error('No prediction result returned');
-    }
+    const predictionResult = config.pythonWorker.enabled
+      ? await runWithWorker(data, hasAddresses)
+      : await runWithScript(data, hasAddresses);
 
-    try {
-      // Parse the JSON output from the Python script
-      const predictionResult = JSON.parse(results);
-      
-      // Return formatted response with the model's prediction
-      const response = {
-        distance_meters: predictionResult.distance_meters,
-        eta_minutes: predictionResult.estimated_eta_minutes,
-        request: {
-          pickup: hasAddresses ? 
-            { address: pickup_address, lat: predictionResult.pickup_lat, lon: predictionResult.pickup_lon } :
-            { lat: pickup_lat, lon: pickup_lon },
-          dropoff: hasAddresses ? 
-            { address: dropoff_address, lat: predictionResult.drop_lat, lon: predictionResult.drop_lon } :
-            { lat: drop_lat, lon: drop_lon },
-          time: {
-            pickup_time_utc: pickup_time_utc,
-            pickup_local_time: predictionResult.pickup_local_time,
-            day_of_week: predictionResult.day_of_week,
-            hour_of_day: predictionResult.hour_of_day
-          }
-        },
-        timestamp: new Date().toISOString()
-      };
-      
-      return response;
-    } catch (parseError) {
-      logger.error('Error parsing prediction result:', parseError);
-      throw new Error(`Invalid prediction result format: ${parseError.message}`);
-    }
+    // Return formatted response with the model's prediction
+    const response = {
+      distance_meters: predictionResult.distance_meters,
+      eta_minutes: predictionResult.estimated_eta_minutes,
+      request: {
+        pickup: hasAddresses ? 
+          { address: pickup_address, lat: predictionResult.pickup_lat, lon: predictionResult.pickup_lon } :
+          { lat: pickup_lat, lon: pickup_lon },
+        dropoff: hasAddresses ? 
+          { address: dropoff_address, lat: predictionResult.drop_lat, lon: predictionResult.drop_lon } :
+          { lat: drop_lat, lon: drop_lon },
+        time: {
+          pickup_time_utc: pickup_time_utc,
+          pickup_local_time: predictionResult.pickup_local_time,
+          day_of_week: predictionResult.day_of_week,
+          hour_of_day: predictionResult.hour_of_day
+        }
+      },
+      timestamp: new Date().toISOString()
+    };
+    
+    return response;
   } catch (error) {
     logger.error('Combined prediction error:', error);
     throw error;
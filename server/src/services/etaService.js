@@ -5,6 +5,155 @@ const path = require('path');
 const config = require('../config');
 const logger = require('../utils/logger');
 const moment = require('moment-timezone');
+const { callWorker } = require('./pythonWorker');
+
+/**
+ * Run the ETA prediction on the resident Python worker
+ * @param {Object} data - Validated request data
+ * @param {boolean} hasAddresses - Whether the request is address-based
+ * @param {number} hourOfDay - Kuwait-local hour of day
+ * @param {string} dayOfWeek - Kuwait-local day name
+ * @returns {Promise<Object>} - ETA and the coordinates it was computed for
+ */
+const runWithWorker = async (data, hasAddresses, hourOfDay, dayOfWeek) => {
+  const { pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_address, dropoff_address, pickup_time_utc } = data;
+  
+  if (hasAddresses) {
+    logger.debug('Running address-based ETA prediction on Python worker');
+    const predictionResult = await callWorker('predict_combined_address', {
+      pickup_address,
+      dropoff_address,
+      pickup_time_utc,
+      time_budget_ms: config.pythonWorker.geocodeBudgetMs
+    });
+    return {
+      eta: predictionResult.estimated_eta_minutes,
+      actualPickupLat: predictionResult.pickup_lat,
+      actualPickupLon: predictionResult.pickup_lon,
+      actualDropLat: predictionResult.drop_lat,
+      actualDropLon: predictionResult.drop_lon
+    };
+  }
+  
+  logger.debug('Running coordinate-based ETA prediction on Python worker');
+  const predictionResult = await callWorker('predict_eta', {
+    pickup_lat,
+    pickup_lon,
+    drop_lat,
+    drop_lon,
+    hour_of_day: hourOfDay,
+    day_of_week: dayOfWeek
+  });
+  return {
+    eta: predictionResult.estimated_eta_minutes,
+    actualPickupLat: pickup_lat,
+    actualPickupLon: pickup_lon,
+    actualDropLat: drop_lat,
+    actualDropLon: drop_lon
+  };
+};
+
+/**
+ * Run the ETA prediction by spawning a one-shot Python script
+ * @param {Object} data - Validated request data
+ * @param {boolean} hasAddresses - Whether the request is address-based
+ * @param {number} hourOfDay - Kuwait-local hour of day
+ * @param {string} dayOfWeek - Kuwait-local day name
+ * @returns {Promise<Object>} - ETA and the coordinates it was computed for
+ */
+const runWithScript = async (data, hasAddresses, hourOfDay, dayOfWeek) => {
+  const { pickup_lat, pickup_lon, drop_lat, drop_lon, pickup_address, dropoff_address, pickup_time_utc } = data;
+  
+  // Use direct child_process execution
+  const { execFile } = require('child_process');
+  let scriptPath, scriptArgs, actualPickupLat, actualPickupLon, actualDropLat, actualDropLon;
+  
+  if (hasAddresses) {
+    // Use simple address-based prediction script for ETA
+    scriptPath = path.join(__dirname, '../scripts/simple_combined_address.py');
+    scriptArgs = [scriptPath, pickup_address, dropoff_address, pickup_time_utc];
+    logger.debug(`Running address-based ETA prediction script: ${scriptPath}`);
+  } else {
+    // Use coordinate-based prediction script
+    scriptPath = path.join(__dirname, '../scripts/predict_eta.py');
+    scriptArgs = [
+      scriptPath,
+      pickup_lat.toString(),
+      pickup_lon.toString(),
+      drop_lat.toString(),
+      drop_lon.toString(),
+      hourOfDay.toString(),
+      dayOfWeek
+    ];
+    actualPickupLat = pickup_lat;
+    actualPickupLon = pickup_lon;
+    actualDropLat = drop_lat;
+    actualDropLon = drop_lon;
+    logger.debug(`Running coordinate-based ETA prediction script: ${scriptPath}`);
+  }
+  
+  // Run Python script with model
+  const results = await new Promise((resolve, reject) => {
+    execFile(
+      config.pythonPath, 
+      scriptArgs, 
+      { timeout: config.requestTimeout || 60000 },
+      (err, stdout, stderr) => {
+        if (err) {
+          logger.error('Python script execution error:', err);
+          logger.error('Python stderr:', stderr);
+          return reject(err);
+        }
+        
+        if (stderr) {
+          logger.warn('Python stderr (non-fatal):', stderr);
+        }
+        
+        logger.debug('Python stdout:', stdout);
+        resolve(stdout.trim());
+      }
+    );
+  });
+
+  // Parse the result
+  if (!results) {
+    throw new Error('No prediction result returned');
+  }
+
+  let eta, predictionResult;
+  
+  if (hasAddresses) {
+    // Parse JSON response from address-based script
+    try {
+      predictionResult = JSON.parse(results);
+      eta = predictionResult.estimated_eta_minutes;
+      actualPickupLat = predictionResult.pickup_lat;
+      actualPickupLon = predictionResult.pickup_lon;
+      actualDropLat = predictionResult.drop_lat;
+      actualDropLon = predictionResult.drop_lon;
+    } catch (parseError) {
+      logger.error('Error parsing address-based prediction result:', parseError);
+      throw new Error(`Invalid prediction result format: ${parseError.message}`);
+    }
+  } else {
+    // Parse text response from coordinate-based script
+    const output = results;
+    logger.debug(`Python script output: ${output}`);
+
+    // Extract the numeric value from the formatted output
+    // Expected format: "Estimated Delivery Duration: 41.95 minutes"
+    const match = output.match(/(\d+\.\d+)/);
+    
+    if (!match) {
+      logger.error('Could not parse prediction result:', output);
+      throw new Error('Invalid prediction result format');
+    }
+    
+    eta = parseFloat(match[1]);
+  }
+  
+  return { eta, actualPickupLat, actualPickupLon, actualDropLat, actualDropLon };
+};
 
 /**
  * Get ETA prediction from model
@@ -113,93 +262,9 @@ const predictETA = async (data) => {
       throw new Error('Missing time parameters: either pickup_time_utc or (hour_of_day and day_of_week) must be provided');
     }
 
-    // Use direct child_process execution
-    const { execFile } = require('child_process');
-    let scriptPath, scriptArgs, actualPickupLat, actualPickupLon, actualDropLat, actualDropLon;
-    
-    if (hasAddresses) {
-      // Use simple address-based prediction script for ETA
-      scriptPath = path.join(__dirname, '../scripts/simple_combined_address.py');
-      scriptArgs = [scriptPath, pickup_address, dropoff_address, pickup_time_utc];
-      logger.debug(`Running address-based ETA prediction script: ${scriptPath}`);
-    } else {
-      // Use coordinate-based prediction script
-      scriptPath = path.join(__dirname, '../scripts/predict_eta.py');
-      scriptArgs = [
-        scriptPath,
-        pickup_lat.toString(),
-        pickup_lon.toString(),
-        drop_lat.toString(),
-        drop_lon.toString(),
-        hourOfDay.toString(),
-        dayOfWeek
-      ];
-      actualPickupLat = pickup_lat;
-      actualPickupLon = pickup_lon;
-      actualDropLat = drop_lat;
-      actualDropLon = drop_lon;
-      logger.debug(`Running coordinate-based ETA prediction script: ${scriptPath}`);
-    }
-    
-    // Run Python script with model
-    const results = await new Promise((resolve, reject) => {
-      execFile(
-        config.pythonPath, 
-        scriptArgs, 
-        { timeout: config.requestTimeout || 60000 },
-        (err, stdout, stderr) => {
-          if (err) {
-            logger.error('Python script execution error:', err);
-            logger.error('Python stderr:', stderr);
-            return reject(err);
-          }
-          
-          if (stderr) {
-            logger.warn('Python stderr (non-fatal):', stderr);
-          }
-          
-          logger.debug('Python stdout:', stdout);
-          resolve(stdout.trim());
-        }
-      );
-    });
-
-    // Parse the result
-    if (!results) {
-      throw new Error('No prediction result returned');
-    }
-
-    let eta, predictionResult;
-    
-    if (hasAddresses) {
-      // Parse JSON response from address-based script
-      try {
-        predictionResult = JSON.parse(results);
-        eta = predictionResult.estimated_eta_minutes;
-        actualPickupLat = predictionResult.pickup_lat;
-        actualPickupLon = predictionResult.pickup_lon;
-        actualDropLat = predictionResult.drop_lat;
-        actualDropLon = predictionResult.drop_lon;
-      } catch (parseError) {
-        logger.error('Error parsing address-based prediction result:', parseError);
-        throw new Error(`Invalid prediction result format: ${parseError.message}`);
-      }
-    } else {
-      // Parse text response from coordinate-based script
-      const output = results;
-      logger.debug(`Python script output: ${output}`);
-
-      // Extract the numeric value from the formatted output
-      // Expected format: "Estimated Delivery Duration: 41.95 minutes"
-      const match = output.match(/(\d+\.\d+)/);
-      
-      if (!match) {
-        logger.error('Could not parse prediction result:', output);
-        throw new Error('Invalid prediction result format');
-      }
-      
-      eta = parseFloat(match[1]);
-    }
+    const { eta, actualPickupLat, actualPickupLon, actualDropLat, actualDropLon } = config.pythonWorker.enabled
+      ? await runWithWorker(data, hasAddresses, hourOfDay, dayOfWeek)
+      : await runWithScript(data, hasAddresses, hourOfDay, dayOfWeek);
     
     if (isNaN(eta)) {
       throw new Error('Invalid prediction result');
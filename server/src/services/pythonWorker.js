@@ -0,0 +1,261 @@
+/**
+ * Python Prediction Worker Client
+ * Keeps one long-lived prediction_worker.py process and talks to it over
+ * JSON lines on stdin/stdout, so models are loaded once per process instead
+ * of once per request.
+ */
+const path = require('path');
+const { spawn } = require('child_process');
+const config = require('../config');
+const logger = require('../utils/logger');
+
+const WORKER_SCRIPT = path.join(__dirname, '../scripts/prediction_worker.py');
+
+class PythonWorker {
+  /**
+   * @param {Object} [options]
+   * @param {string} [options.pythonPath] - Python interpreter
+   * @param {string} [options.scriptPath] - Worker script
+   * @param {string[]} [options.args] - Extra worker CLI arguments
+   * @param {number} [options.requestTimeout] - Per-call timeout in milliseconds, counted once the worker is ready
+   * @param {number} [options.startTimeout] - How long the worker may take to emit its ready event
+   */
+  constructor(options = {}) {
+    this.pythonPath = options.pythonPath || config.pythonPath;
+    this.scriptPath = options.scriptPath || WORKER_SCRIPT;
+    this.args = options.args || [];
+    this.requestTimeout = options.requestTimeout || config.requestTimeout || 60000;
+    this.startTimeout = options.startTimeout || config.pythonWorker.startTimeout || 300000;
+    this.process = null;
+    this.ready = false;
+    this.startTimer = null;
+    this.buffer = '';
+    this.nextId = 1;
+    this.pending = new Map();
+    // Calls made while the worker is still loading its models, sent once it is ready
+    this.queue = [];
+  }
+
+  /**
+   * Spawn the worker process if it is not already running
+   */
+  start() {
+    if (this.process) {
+      return;
+    }
+
+    logger.info(`Starting Python prediction worker: ${this.scriptPath}`);
+    const child = spawn(this.pythonPath, [this.scriptPath, ...this.args], {
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+    this.process = child;
+    this.ready = false;
+    this.buffer = '';
+    this.startTimer = setTimeout(() => {
+      logger.error(`Python worker was not ready after ${this.startTimeout}ms; restarting it`);
+      this.restart(child, new Error(`Python worker did not start within ${this.startTimeout}ms`));
+    }, this.startTimeout);
+
+    // Writing to a worker that just died raises EPIPE here rather than on the process
+    child.stdin.on('error', (err) => {
+      logger.error('Python worker stdin error:', err);
+      this.handleExit(child, err);
+    });
+
+    child.stdout.setEncoding('utf8');
+    child.stdout.on('data', (chunk) => {
+      // Output still buffered from a worker that was restarted belongs to nobody
+      if (this.process === child) {
+        this.handleData(chunk);
+      }
+    });
+
+    child.stderr.setEncoding('utf8');
+    child.stderr.on('data', (chunk) => {
+      logger.warn('Python worker stderr (non-fatal):', chunk.trim());
+    });
+
+    child.on('error', (err) => {
+      logger.error('Python worker process error:', err);
+      this.handleExit(child, err);
+    });
+
+    child.on('exit', (code, signal) => {
+      logger.warn(`Python worker exited (code: ${code}, signal: ${signal})`);
+      this.handleExit(child, new Error(`Python worker exited with code ${code}`));
+    });
+  }
+
+  /**
+   * Split stdout into JSON lines and settle the matching pending calls
+   * @param {string} chunk - Raw stdout data
+   */
+  handleData(chunk) {
+    this.buffer += chunk;
+    let newlineIndex;
+    while ((newlineIndex = this.buffer.indexOf('\n')) !== -1) {
+      const line = this.buffer.slice(0, newlineIndex).trim();
+      this.buffer = this.buffer.slice(newlineIndex + 1);
+      if (!line) {
+        continue;
+      }
+
+      let message;
+      try {
+        message = JSON.parse(line);
+      } catch (parseError) {
+        logger.warn('Ignoring non-JSON worker output:', line);
+        continue;
+      }
+
+      if (message.event) {
+        logger.debug(`Python worker event: ${message.event}`);
+        if (message.event === 'ready') {
+          this.handleReady();
+        }
+        continue;
+      }
+
+      const entry = this.pending.get(message.id);
+      if (!entry) {
+        logger.warn('Received worker response for unknown request id:', message.id);
+        continue;
+      }
+      this.pending.delete(message.id);
+      clearTimeout(entry.timer);
+
+      if (message.error) {
+        entry.reject(new Error(message.error));
+      } else {
+        entry.resolve(message.result);
+      }
+    }
+  }
+
+  /**
+   * Send the calls queued while the worker was loading
+   */
+  handleReady() {
+    this.ready = true;
+    clearTimeout(this.startTimer);
+    this.startTimer = null;
+    const queued = this.queue;
+    this.queue = [];
+    for (const request of queued) {
+      this.send(request);
+    }
+  }
+
+  /**
+   * Reject every queued and in-flight call when the process goes away; the next call respawns it
+   * @param {ChildProcess} child - The process that exited
+   * @param {Error} error - Reason passed to pending callers
+   */
+  handleExit(child, error) {
+    if (this.process !== child) {
+      return;
+    }
+    this.process = null;
+    this.ready = false;
+    clearTimeout(this.startTimer);
+    this.startTimer = null;
+    for (const entry of this.pending.values()) {
+      clearTimeout(entry.timer);
+      entry.reject(error);
+    }
+    this.pending.clear();
+    for (const request of this.queue) {
+      request.reject(error);
+    }
+    this.queue = [];
+  }
+
+  /**
+   * Kill a worker that is stuck and fail its calls; the next call spawns a fresh one
+   * @param {ChildProcess} child - The process to kill
+   * @param {Error} error - Reason passed to pending callers
+   */
+  restart(child, error) {
+    this.handleExit(child, error);
+    child.kill('SIGKILL');
+  }
+
+  /**
+   * Write one call to the worker and start its timeout
+   * @param {Object} request - Queued call ({ id, method, params, timeout, resolve, reject })
+   */
+  send(request) {
+    const { id, method, params, timeout, resolve, reject } = request;
+    const child = this.process;
+    // The worker answers one call at a time, so a call that overran is still blocking the
+    // ones behind it; restart the worker instead of leaving it to finish unheard
+    const timer = setTimeout(() => {
+      logger.error(`Python worker call ${method} timed out after ${timeout}ms; restarting the worker`);
+      this.restart(child, new Error(`Python worker call ${method} timed out after ${timeout}ms`));
+    }, timeout);
+    this.pending.set(id, { resolve, reject, timer });
+    child.stdin.write(`${JSON.stringify({ id, method, params })}\n`);
+  }
+
+  /**
+   * Call a worker method; calls made before the worker is ready wait for it
+   * @param {string} method - Worker method name (e.g. predict_eta_distance)
+   * @param {Object} params - Method parameters
+   * @param {Object} [options]
+   * @param {number} [options.timeout] - Override the per-call timeout
+   * @returns {Promise<Object>} - Method result
+   */
+  call(method, params, options = {}) {
+    this.start();
+    const id = this.nextId++;
+    const timeout = options.timeout || this.requestTimeout;
+
+    return new Promise((resolve, reject) => {
+      const request = { id, method, params, timeout, resolve, reject };
+      if (this.ready) {
+        this.send(request);
+      } else {
+        this.queue.push(request);
+      }
+    });
+  }
+
+  /**
+   * Stop the worker process
+   */
+  stop() {
+    if (this.process) {
+      const child = this.process;
+      this.handleExit(child, new Error('Python worker stopped'));
+      child.stdin.end();
+      child.kill();
+    }
+  }
+}
+
+let sharedWorker = null;
+
+/**
+ * Get the process-wide worker, spawning it on first use
+ * @returns {PythonWorker}
+ */
+const getWorker = () => {
+  if (!sharedWorker) {
+    sharedWorker = new PythonWorker({ args: config.pythonWorker.args });
+  }
+  return sharedWorker;
+};
+
+/**
+ * Call a method on the shared worker
+ * @param {string} method - Worker method name
+ * @param {Object} params - Method parameters
+ * @returns {Promise<Object>} - Method result
+ */
+const callWorker = (method, params) => getWorker().call(method, params);
+
+module.exports = {
+  PythonWorker,
+  getWorker,
+  callWorker
+};
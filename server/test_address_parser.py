@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Conformance test for KuwaitAddressParser
+
+Checks that the compiled parser produces the same components as the original
+extract_* methods on FixedHybridGeocoder, over the test addresses and a large
+randomized set. Only the address dictionaries are needed: the ones in
+server/models are used when present, a small synthetic gazetteer otherwise.
+"""
+
+import sys
+import os
+import json
+import time
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(SERVER_DIR, 'src', 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from geocoder import FixedHybridGeocoder, TEST_ADDRESSES, synthetic_kuwaiti_addresses
+
+SYNTHETIC_COUNT = 5000
+
+SYNTHETIC_ADDRESS_DICTS = {
+    'kuwait_governorates': {
+        'capital': ['kuwait city', 'sharq', 'dasman', 'qibla', 'shuwaikh', 'shuwaikh industrial', 'kaifan',
+                    'rawda', 'surra', 'yarmouk', 'abdullah al-salem', 'qortuba', 'granada', 'doha'],
+        'hawalli': ['hawalli', 'salmiya', 'jabriya', 'rumaithiya', 'salwa', 'mishref', 'bayan', 'maidan hawalli',
+                    'zahra', 'hittin', 'mubarak al-abdullah', 'al-bidea'],
+        'farwaniya': ['farwaniya', 'khaitan', 'jleeb al-shuyoukh', 'ardiya', 'rabia', 'abdullah al-mubarak'],
+        'mubarak al-kabeer': ['mubarak al-kabeer', 'adan', 'qurain', 'sabah al-salem', 'messila', 'abu fatira'],
+        'ahmadi': ['ahmadi', 'fahaheel', 'mangaf', 'fintas', 'mahboula', 'abu halifa', 'sabahiya', 'egaila'],
+        'jahra': ['jahra', 'saad al-abdullah', 'naeem', 'oyoun', 'qasr', 'waha', 'abdali'],
+    },
+    'abbreviation_map': {'st': 'street', 'blk': 'block', 'ave': 'avenue', 'rd': 'road', 'bldg': 'building',
+                         'apt': 'apartment', 'flr': 'floor', 'sharq': 'sharq'},
+    'common_typos': {'salmia': 'salmiya', 'salmiyah': 'salmiya', 'hawali': 'hawalli', 'jabriyah': 'jabriya',
+                     'mishrif': 'mishref', 'farwania': 'farwaniya', 'fahahil': 'fahaheel', 'jahraa': 'jahra',
+                     'sharq': 'sharq', 'kuwait cty': 'kuwait city', 'sabah salem': 'sabah al-salem', 'x': 'y'},
+}
+
+def address_geocoder():
+    """A FixedHybridGeocoder with only the address dictionaries loaded"""
+    dicts_path = os.path.join(SERVER_DIR, 'models', 'address_normalization_dicts.json')
+    if os.path.exists(dicts_path):
+        with open(dicts_path, 'r', encoding='utf-8') as f:
+            address_dicts = json.load(f)
+        source = dicts_path
+    else:
+        address_dicts = json.loads(json.dumps(SYNTHETIC_ADDRESS_DICTS))
+        source = "synthetic gazetteer"
+    # Parsing needs none of the model artifacts that __init__ loads
+    geocoder = FixedHybridGeocoder.__new__(FixedHybridGeocoder)
+    geocoder.load_address_dictionaries(address_dicts)
+    return geocoder, source
+
+def check_address_parser_conformance(synthetic_count=SYNTHETIC_COUNT):
+    print("🏠 KuwaitAddressParser conformance")
+    print("=" * 60)
+    geocoder, source = address_geocoder()
+    addresses = (TEST_ADDRESSES + synthetic_kuwaiti_addresses(geocoder, synthetic_count)
+                 + ['', '   ', None, 'block 5', '123', 'kuwait city', 'Kuwait City Sharq', 'السالمية قطعة ١٠ شارع ٥'])
+    start = time.perf_counter()
+    expected = [geocoder._parse_address_reference(address) for address in addresses]
+    reference_s = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = [geocoder.parse_address_robust(address) for address in addresses]
+    compiled_s = time.perf_counter() - start
+    mismatches = [(address, want, got) for address, want, got in zip(addresses, expected, actual) if want != got]
+    for address, want, got in mismatches[:10]:
+        print(f"❌ Mismatch for {address!r}:\n    reference: {want}\n    compiled:  {got}")
+    print(f"{'✅' if not mismatches else '❌'} {len(addresses) - len(mismatches)}/{len(addresses)} addresses identical "
+          f"({source}); {reference_s * 1e6 / len(addresses):.1f} us -> {compiled_s * 1e6 / len(addresses):.1f} us per address")
+    return not mismatches
+
+def test_address_parser_conformance():
+    assert check_address_parser_conformance(), "KuwaitAddressParser differs from the extract_* reference parse"
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    if check_address_parser_conformance(count):
+        print("\n🎉 KuwaitAddressParser matches the reference parse.")
+    else:
+        print("\n💥 KuwaitAddressParser differs from the reference parse!")
+        sys.exit(1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Import-time budget test for the prediction entry points
+
+Imports each module in a fresh interpreter under `python -X importtime` and fails
+when the import takes longer than its budget or pulls in a model library
+(torch, sentence_transformers, faiss, xgboost, lightgbm) before first use.
+"""
+
+import sys
+import os
+import re
+import subprocess
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(SERVER_DIR, 'src', 'scripts')
+
+MODEL_LIBRARIES = ('torch', 'sentence_transformers', 'faiss', 'xgboost', 'lightgbm')
+
+# module: (directory, budget in milliseconds or None for the library check only)
+IMPORT_BUDGETS = {
+    'predict_eta': (SCRIPTS_DIR, 100),
+    'predict_combined': (SCRIPTS_DIR, 100),
+    'simple_combined_address': (SCRIPTS_DIR, 100),
+    'prediction_worker': (SCRIPTS_DIR, 100),
+    'geocoder': (SCRIPTS_DIR, None),
+    'combinedModel': (SERVER_DIR, None),
+}
+
+# The worker is what the Node service spawns, so it must import even without optional dependencies
+REQUIRED_MODULES = ('prediction_worker',)
+
+class MissingDependency(RuntimeError):
+    """The import failed only because a third-party package is not installed"""
+
+def measure_import(module, directory):
+    """Return (cumulative import time in ms, set of top-level modules imported)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=directory, capture_output=True, text=True, encoding='utf-8'
+    )
+    if result.returncode != 0:
+        last_line = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ''
+        missing = re.match(r"ModuleNotFoundError: No module named '([^']+)'", last_line)
+        # A missing sibling script is a broken import, not an absent optional package
+        if missing and not any(os.path.exists(os.path.join(d, missing.group(1).split('.')[0] + '.py'))
+                               for d in (SCRIPTS_DIR, SERVER_DIR)):
+            raise MissingDependency(last_line)
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    cumulative_us = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        name = fields[2].strip()
+        if not fields[1].strip().isdigit():
+            continue  # column header
+        imported.add(name.split('.')[0])
+        if name == module:
+            cumulative_us = int(fields[1])
+    return (cumulative_us or 0) / 1000, imported
+
+def check_import_time_budgets():
+    print("⏱️  Import-time budgets for prediction entry points")
+    print("=" * 60)
+    passed = True
+    for module, (directory, budget_ms) in IMPORT_BUDGETS.items():
+        try:
+            elapsed_ms, imported = measure_import(module, directory)
+        except MissingDependency as e:
+            if module in REQUIRED_MODULES:
+                print(f"❌ {module}: {e}")
+                passed = False
+            else:
+                # A missing optional dependency is not an import-time regression
+                print(f"⚠️  {module}: skipped ({e})")
+            continue
+        except RuntimeError as e:
+            print(f"❌ {module}: {e}")
+            passed = False
+            continue
+        eager = sorted(lib for lib in MODEL_LIBRARIES if lib in imported)
+        over_budget = budget_ms is not None and elapsed_ms > budget_ms
+        ok = not eager and not over_budget
+        passed = passed and ok
+        budget = f"{budget_ms} ms" if budget_ms is not None else "n/a"
+        print(f"{'✅' if ok else '❌'} {module}: {elapsed_ms:.1f} ms (budget {budget})"
+              + (f", eagerly imports {', '.join(eager)}" if eager else ""))
+    return passed
+
+def test_import_time_budgets():
+    # Under pytest a returned False would only warn, so assert on it
+    assert check_import_time_budgets(), "an entry point failed to import, imported a model library or went over budget"
+
+if __name__ == "__main__":
+    if check_import_time_budgets():
+        print("\n🎉 All entry points import within budget.")
+    else:
+        print("\n💥 Import-time budget exceeded!")
+        sys.exit(1)
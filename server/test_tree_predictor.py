@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Parity test and latency benchmark for the flattened tree predictor
+
+Checks that tree_predictor.FlatTreeEnsemble reaches the same leaves and returns
+the same predictions as XGBoost, for the geocoder's two-model and multi-output
+layouts. Run directly, it also times both predictors at batch size 1 and 10k.
+The trained models in server/models are used when present, small synthetic
+models otherwise.
+"""
+
+import sys
+import os
+import time
+
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(SERVER_DIR, 'src', 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+
+from tree_predictor import compile_model
+
+BATCH_SIZES = (1, 10000)
+
+def synthetic_geocoder_data(n_rows=4000, n_features=64, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features)).astype(np.float32)
+    X[::9, 3] = np.nan
+    y = np.column_stack([29.3 + 0.05 * X[:, 0] + 0.02 * np.nan_to_num(X[:, 3]), 47.9 + 0.05 * X[:, 1]])
+    return X, y
+
+def geocoder_models():
+    """[(name, booster, X)] for the XGBoost coordinate models"""
+    import xgboost as xgb
+    models_path = os.path.join(SERVER_DIR, 'models', 'hybrid_xgbfaiss_geocoder.pkl')
+    if os.path.exists(models_path):
+        import joblib
+        import geocoder  # noqa: F401 - registers the pickled classes
+        xgb_geocoder = joblib.load(models_path).xgb_geocoder
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(2000, xgb_geocoder.n_features_in_)).astype(np.float32)
+        if xgb_geocoder.coord_model is not None:
+            return [('geocoder coord_model', xgb_geocoder.coord_model, X)]
+        return [('geocoder lat_model', xgb_geocoder.lat_model, X), ('geocoder lon_model', xgb_geocoder.lon_model, X)]
+    X, y = synthetic_geocoder_data()
+    params = {'n_estimators': 200, 'max_depth': 6, 'learning_rate': 0.1, 'subsample': 0.8,
+              'colsample_bytree': 0.8, 'tree_method': 'hist', 'random_state': 42}
+    lat_model = xgb.XGBRegressor(**params).fit(X, y[:, 0])
+    coord_model = xgb.XGBRegressor(**params, multi_strategy='multi_output_tree').fit(X, y)
+    return [('synthetic lat_model', lat_model, X), ('synthetic coord_model', coord_model, X)]
+
+def library_leaves(model, X):
+    import xgboost as xgb
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    return booster.predict(xgb.DMatrix(X), pred_leaf=True)
+
+def time_ms(predict, X, repeats):
+    predict(X)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict(X)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+def parity(model, flat, X):
+    """(same leaves, identical predictions) of the flattened model against XGBoost on X"""
+    sample = X[:2000]
+    same_leaves = np.array_equal(flat.leaf_indices(sample), library_leaves(model, sample).reshape(len(sample), -1))
+    library_pred = np.asarray(model.predict(sample))
+    flat_pred = flat.predict(sample)
+    identical = library_pred.dtype == flat_pred.dtype and np.array_equal(library_pred, flat_pred.reshape(library_pred.shape))
+    return same_leaves, identical
+
+def test_tree_predictor_parity():
+    for name, model, X in geocoder_models():
+        flat = compile_model(model)
+        assert flat is not None, f"{name}: could not be flattened"
+        same_leaves, identical = parity(model, flat, X)
+        assert same_leaves, f"{name}: flattened trees reach different leaves than XGBoost"
+        assert identical, f"{name}: flattened predictions differ from XGBoost"
+
+def benchmark_tree_predictor():
+    print("🌲 Flattened tree predictor: parity and latency")
+    print("=" * 60)
+    passed = True
+    rows = []
+    for name, model, X in geocoder_models():
+        flat = compile_model(model)
+        if flat is None:
+            print(f"❌ {name}: could not be flattened")
+            passed = False
+            continue
+        same_leaves, identical = parity(model, flat, X)
+        ok = same_leaves and identical
+        passed = passed and ok
+        print(f"{'✅' if ok else '❌'} {name}: {flat.n_trees} trees, same leaves {same_leaves}, identical predictions {identical}")
+        for batch_size in BATCH_SIZES:
+            batch = X[np.arange(batch_size) % len(X)]
+            repeats = 200 if batch_size == 1 else 3
+            rows.append((name, batch_size, time_ms(model.predict, batch, repeats), time_ms(flat.predict, batch, repeats)))
+    print(f"\n{'model':<24} {'batch':>6} {'library ms':>11} {'flattened ms':>13} {'speedup':>8}")
+    for name, batch_size, library_ms, flat_ms in rows:
+        print(f"{name:<24} {batch_size:>6} {library_ms:>11.3f} {flat_ms:>13.3f} {library_ms / max(flat_ms, 1e-9):>7.2f}x")
+    return passed
+
+if __name__ == "__main__":
+    if benchmark_tree_predictor():
+        print("\n🎉 Flattened predictions match XGBoost.")
+    else:
+        print("\n💥 Flattened predictions differ from XGBoost!")
+        sys.exit(1)